@@ -1,15 +1,13 @@
 from __future__ import annotations
 
 import logging
-from io import BytesIO
-from typing import Any
+import struct
+from typing import IO
 
 import py7zr
 import requests
 from py7zr import FileInfo, exceptions
 
-import ckan.plugins.toolkit as tk
-
 import ckanext.unfold.exception as unf_exception
 import ckanext.unfold.types as unf_types
 import ckanext.unfold.utils as unf_utils
@@ -17,9 +15,14 @@ from ckanext.unfold.adapters.base import BaseAdapter
 
 log = logging.getLogger(__name__)
 
+# The signature header: magic, format version, start header CRC, then the
+# offset (relative to the end of this header), size and CRC of the next
+# header, which holds the file list.
+SIGNATURE_HEADER = struct.Struct("<6sBBIQQI")
+
 
 class SevenZipAdapter(BaseAdapter):
-    def get_node_list(self) -> list[unf_types.Node]:
+    def get_entries(self) -> list[unf_types.Entry]:
         try:
             file_list = self.get_file_list_from_url(self.filepath)
         except exceptions.ArchiveError as e:
@@ -27,49 +30,57 @@ class SevenZipAdapter(BaseAdapter):
         except requests.RequestException as e:
             raise unf_exception.UnfoldError(f"Error fetching archive: {e}") from e
 
-        return [self._build_node(entry) for entry in file_list]
-
-    def _build_node(self, entry: FileInfo) -> unf_types.Node:
-        parts = [p for p in entry.filename.split("/") if p]
-        name = unf_utils.name_from_path(entry.filename)
-        fmt = "folder" if entry.is_directory else unf_utils.get_format_from_name(name)
-
-        return unf_types.Node(
-            id=entry.filename.rstrip("/") or "",
-            text=unf_utils.name_from_path(entry.filename),
-            icon=(
-                "fa fa-folder"
-                if entry.is_directory
-                else unf_utils.get_icon_by_format(fmt)
-            ),
-            state={"opened": True},
-            parent="/".join(parts[:-1]) if parts[:-1] else "#",
-            data=self._prepare_table_data(entry),
-        )
-
-    def _prepare_table_data(self, entry: FileInfo) -> dict[str, Any]:
-        modified_at = tk.h.render_datetime(
-            entry.creationtime, date_format=unf_utils.DEFAULT_DATE_FORMAT
-        )
-
-        return {
-            "size": (
-                unf_utils.printable_file_size(entry.compressed)
-                if entry.compressed
-                else ""
-            ),
-            "modified_at": modified_at or "",
-        }
+        return [
+            unf_types.Entry(
+                entry.filename,
+                entry.is_directory,
+                entry.uncompressed,
+                (
+                    unf_utils.timestamp_from_datetime(entry.creationtime)
+                    if entry.creationtime
+                    else None
+                ),
+                entry.compressed,
+            )
+            for entry in file_list
+        ]
 
     def get_file_list_from_url(self, url: str) -> list[FileInfo]:
-        """Download an archive and fetch a file list.
-
-        7z file doesn't allow us to download it partially
-        and fetch only file list.
+        """Fetch a file list of an archive.
+
+        The file list lives in the "next header", whose offset and size are
+        stored in the 32-byte signature header at the start of the file. When
+        the server honors ``Range``, only those two regions are fetched (plus
+        the packed header streams, if the header is encoded) and py7zr reads
+        them from a sparse file object. Otherwise the whole archive is
+        downloaded.
         """
-        content = self.get_file_content(url)
+        with self.open_range_file(url, max_blocks=None) as fileobj:
+            if fileobj is not None:
+                self._prefetch_next_header(fileobj)
+                return self._list_archive(fileobj)
+
+        with self.open_file_content(url) as fileobj:
+            return self._list_archive(fileobj)
+
+    @staticmethod
+    def _prefetch_next_header(fileobj: IO[bytes]) -> None:
+        """Fetch the whole next header in one go, before py7zr parses it."""
+        fileobj.seek(0)
+        header = fileobj.read(SIGNATURE_HEADER.size)
+
+        if len(header) < SIGNATURE_HEADER.size:
+            return
+
+        _, _, _, _, offset, size, _ = SIGNATURE_HEADER.unpack(header)
+
+        fileobj.seek(SIGNATURE_HEADER.size + offset)
+        fileobj.read(size)
+        fileobj.seek(0)
 
-        archive = py7zr.SevenZipFile(BytesIO(content))
+    @staticmethod
+    def _list_archive(fileobj: IO[bytes]) -> list[FileInfo]:
+        archive = py7zr.SevenZipFile(fileobj)
 
         if archive.needs_password():
             raise unf_exception.UnfoldError("Error. Archive is protected with password")
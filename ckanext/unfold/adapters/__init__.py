@@ -1,5 +1,5 @@
 from ckanext.unfold import types as unf_types
-from ckanext.unfold.adapters import _7z, ar, rar, rpm, tar, zip
+from ckanext.unfold.adapters import _7z, ar, compressed, rar, rpm, tar, zip
 from ckanext.unfold.adapters.base import BaseAdapter
 from ckanext.unfold.types import Registry
 
@@ -14,6 +14,12 @@ ADAPTERS: dict[str, type[BaseAdapter]] = {
     "tar.gz": tar.TarGzAdapter,
     "tar.xz": tar.TarXzAdapter,
     "tar.bz2": tar.TarBz2Adapter,
+    "tar.zst": tar.TarZstAdapter,
+    "tzst": tar.TarZstAdapter,
+    "gz": compressed.GzipAdapter,
+    "zst": compressed.ZstdAdapter,
+    "xz": compressed.XzAdapter,
+    "bz2": compressed.Bz2Adapter,
     "rpm": rpm.RpmAdapter,
     "deb": ar.ArAdapter,
     "ar": ar.ArAdapter,
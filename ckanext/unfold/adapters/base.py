@@ -1,7 +1,13 @@
 from __future__ import annotations
 
 import logging
-from typing import Any
+import re
+import shutil
+from collections.abc import Iterable, Iterator
+from contextlib import ExitStack, contextmanager
+from tempfile import SpooledTemporaryFile
+from typing import IO, Any, cast
+from urllib.parse import urlsplit, urlunsplit
 
 import requests
 
@@ -12,10 +18,167 @@ import ckanext.unfold.config as unf_config
 import ckanext.unfold.exception as unf_exception
 import ckanext.unfold.types as unf_types
 import ckanext.unfold.utils as unf_utils
+from ckanext.unfold.adapters import session as unf_session
+from ckanext.unfold.adapters.streams import ChunkStream, MappedFile, RangeFile
 
 log = logging.getLogger(__name__)
 
-DEFAULT_TIMEOUT = 60  # seconds
+CHUNK_SIZE = 65536
+# Granularity of ranged reads. Big enough to batch the headers of neighbouring
+# small members into one request, small enough to skip over large members.
+RANGE_BLOCK_SIZE = 65536
+FOLDER_ICON = "fa fa-folder"
+# empty and "." path components, which don't name a directory of their own
+REDUNDANT_PATH_PARTS = re.compile(r"//|(^|/)\.(/|$)")
+
+
+class TreeBuilder:
+    """Build an archive tree from the entries listed by an adapter.
+
+    Every entry is placed in a single pass. Its parent is looked up by path
+    and the id of the parent is stored for every child, so the parent paths
+    are shared rather than rebuilt per entry. Directories that are only
+    implied by the paths below them get a node of their own. An entry that
+    is listed again, e.g. a file appended to a tar archive, replaces the
+    earlier one, as it would when extracting the archive.
+
+    Once all entries are placed, every directory gets the totals of its
+    subtree: the uncompressed and compressed size and the number of files
+    below it, and the newest modification time.
+    """
+
+    def __init__(self) -> None:
+        self.nodes = unf_types.NodeTable()
+        self._rows: dict[str, int] = {}
+        self._parent_rows: list[int] = []
+        self._dirs = bytearray()
+
+    def build(self, entries: Iterable[unf_types.Entry]) -> unf_types.NodeTable:
+        for entry in entries:
+            self.add(*entry)
+
+        self._aggregate()
+
+        return self.nodes
+
+    def add(
+        self,
+        path: str,
+        is_dir: bool,
+        size: int | None = None,
+        modified_at: int | None = None,
+        compressed_size: int | None = None,
+    ) -> None:
+        node_id = path.strip("/")
+
+        if REDUNDANT_PATH_PARTS.search(node_id):
+            node_id = "/".join(p for p in node_id.split("/") if p not in ("", "."))
+
+        if not node_id:
+            return
+
+        row = self._rows.get(node_id)
+
+        if row is None:
+            parent, _, text = node_id.rpartition("/")
+            self._ensure_dir(parent)
+            row = self._append(node_id, text, parent, is_dir)
+        else:
+            self.nodes.icons[row] = self._icon(self.nodes.texts[row], is_dir)
+            self._dirs[row] = is_dir
+
+        self.nodes.sizes[row] = size
+        self.nodes.compressed_sizes[row] = compressed_size
+        self.nodes.modified_at[row] = modified_at
+
+    def _ensure_dir(self, path: str) -> None:
+        """Add the directory at ``path`` and its ancestors, if they're missing."""
+        missing: list[str] = []
+
+        while path and path not in self._rows:
+            missing.append(path)
+            path = path.rpartition("/")[0]
+
+        for dir_path in reversed(missing):
+            parent, _, text = dir_path.rpartition("/")
+            self._append(dir_path, text, parent, True)
+
+    def _append(self, node_id: str, text: str, parent: str, is_dir: bool) -> int:
+        row = self._rows[node_id] = len(self.nodes)
+        parent_row = self._rows[parent] if parent else -1
+
+        self.nodes.ids.append(node_id)
+        self.nodes.texts.append(text)
+        self.nodes.parents.append(self.nodes.ids[parent_row] if parent else "#")
+        self.nodes.icons.append(self._icon(text, is_dir))
+        self.nodes.children.append(False)
+
+        for column in self.nodes.table_columns.values():
+            column.append(None)
+
+        self._parent_rows.append(parent_row)
+        self._dirs.append(is_dir)
+
+        return row
+
+    def _aggregate(self) -> None:
+        """Sum up the subtree of every directory.
+
+        A directory is always placed before anything inside it, so walking
+        the rows backwards visits every subtree before its root, and the
+        totals are carried up in one pass.
+        """
+        nodes = self.nodes
+        count = len(nodes)
+        sizes = [0] * count
+        compressed_sizes: list[int | None] = [None] * count
+        file_counts = [0] * count
+        newest: list[int | None] = [None] * count
+
+        for row in range(count - 1, -1, -1):
+            if not self._dirs[row]:
+                sizes[row] += nodes.sizes[row] or 0
+                compressed_sizes[row] = _add(
+                    compressed_sizes[row], nodes.compressed_sizes[row]
+                )
+                file_counts[row] += 1
+
+            newest[row] = _newest(newest[row], nodes.modified_at[row])
+
+            if self._dirs[row]:
+                nodes.sizes[row] = sizes[row]
+                nodes.compressed_sizes[row] = compressed_sizes[row]
+                nodes.file_counts[row] = file_counts[row]
+                nodes.modified_at[row] = newest[row]
+
+            if (parent := self._parent_rows[row]) >= 0:
+                sizes[parent] += sizes[row]
+                compressed_sizes[parent] = _add(
+                    compressed_sizes[parent], compressed_sizes[row]
+                )
+                file_counts[parent] += file_counts[row]
+                newest[parent] = _newest(newest[parent], newest[row])
+
+    @staticmethod
+    def _icon(name: str, is_dir: bool) -> str:
+        if is_dir:
+            return FOLDER_ICON
+
+        dot = name.rfind(".")
+
+        return unf_utils.get_icon_by_format(name[dot + 1 :] if dot > 0 else "")
+
+
+def _add(total: int | None, value: int | None) -> int | None:
+    """Add up values that may be unknown, which is only the case if all are."""
+    return total if value is None else (total or 0) + value
+
+
+def _newest(current: int | None, value: int | None) -> int | None:
+    if value is None or (current is not None and current >= value):
+        return current
+
+    return value
 
 
 class BaseAdapter:
@@ -45,12 +208,139 @@ class BaseAdapter:
     def is_upload(self) -> bool:
         return self.resource.get("url_type") == "upload"
 
-    def build_archive_tree(self) -> list[unf_types.Node]:
+    def get_fingerprint(self) -> unf_types.Fingerprint | None:
+        """Return a fingerprint identifying the content of the archive.
+
+        Archives with the same fingerprint share a cache entry. Remote
+        archives are identified by their URL and the ``ETag`` (or
+        ``Last-Modified``) and ``Content-Length`` their server reports, as
+        default validators (e.g. nginx's, made of the time and size) are only
+        unique for a single URL. Uploads are identified by the resource, the
+        size and the modification time; the ``hash`` field is not used, as
+        CKAN doesn't compute it and any editor can set it. ``None`` means
+        the content can't be identified, and the archive is cached per
+        resource.
+        """
+        if not self.is_upload:
+            return self._fetch_fingerprint(self.filepath)
+
+        size = self._resource_size()
+        last_modified = self.resource.get("last_modified")
+
+        if size and last_modified:
+            return unf_types.Fingerprint(
+                f"upload:{self.resource['id']}:{size}:{last_modified}"
+            )
+
+        return None
+
+    def revalidate(
+        self, fingerprint: unf_types.Fingerprint
+    ) -> unf_types.Fingerprint | None:
+        """Check whether a remote archive changed since it was fingerprinted.
+
+        Sends a conditional ``HEAD`` request, so an unchanged archive costs
+        a single ``304 Not Modified``. Returns ``fingerprint`` itself if the
+        archive is unchanged, and a fresh fingerprint otherwise. Raises
+        ``UnfoldError`` if the server can't tell, i.e. it can't be reached or
+        answers with an error (e.g. a transient ``503``), which says nothing
+        about the archive.
+        """
+        if self.is_upload or not (fingerprint.etag or fingerprint.last_modified):
+            return fingerprint
+
+        headers: dict[str, str] = {}
+
+        if fingerprint.etag:
+            headers["If-None-Match"] = fingerprint.etag
+
+        if fingerprint.last_modified:
+            headers["If-Modified-Since"] = fingerprint.last_modified
+
+        try:
+            resp = self._head(self.filepath, headers)
+        except requests.RequestException as e:
+            raise unf_exception.UnfoldError(f"Error revalidating archive: {e}") from e
+
+        if resp.status_code == 304:
+            return fingerprint
+
+        if not resp.ok:
+            raise unf_exception.UnfoldError(
+                f"Error revalidating archive: HTTP {resp.status_code}"
+            )
+
+        current = self._fingerprint_from_headers(self.filepath, resp)
+
+        if current and current.value == fingerprint.value:
+            return fingerprint
+
+        return current
+
+    def _fetch_fingerprint(self, url: str) -> unf_types.Fingerprint | None:
+        try:
+            resp = self._head(url)
+        except requests.RequestException as e:
+            log.warning("Unfold: cannot fetch archive headers from %s: %s", url, e)
+            return None
+
+        return self._fingerprint_from_headers(url, resp)
+
+    @staticmethod
+    def _head(url: str, headers: dict[str, str] | None = None) -> requests.Response:
+        return unf_session.get_session().head(
+            url,
+            headers=headers,
+            timeout=unf_session.get_timeout(),
+            allow_redirects=True,
+        )
+
+    @staticmethod
+    def _fingerprint_from_headers(
+        url: str, resp: requests.Response
+    ) -> unf_types.Fingerprint | None:
+        etag = resp.headers.get("ETag")
+        last_modified = resp.headers.get("Last-Modified")
+        content_length = resp.headers.get("Content-Length")
+
+        if not resp.ok or not content_length or not (etag or last_modified):
+            return None
+
+        if etag:
+            value = f"etag:{etag}:{content_length}"
+        else:
+            value = f"modified:{last_modified}:{content_length}"
+
+        return unf_types.Fingerprint(
+            f"{_normalize_url(url)}\0{value}",
+            etag=etag,
+            last_modified=last_modified,
+        )
+
+    def build_archive_tree(self) -> unf_types.NodeTable:
         self.validate_size_limit()
 
-        return self.get_node_list()
+        entries = self.get_entries()
+
+        if entries is None:
+            nodes = unf_types.NodeTable.from_nodes(self.get_node_list())
+        else:
+            nodes = TreeBuilder().build(entries)
+
+        parent_ids = set(nodes.parents)
+
+        # lets the tree view load the contents of directories on demand
+        for index, node_id in enumerate(nodes.ids):
+            if node_id in parent_ids:
+                nodes.children[index] = True
+
+        return nodes
 
     def validate_size_limit(self) -> None:
+        self.enforce_size_limit(self._resource_size())
+
+    def _resource_size(self) -> int | None:
+        """Return the archive size from the resource metadata, if known."""
         archive_size = self.resource.get("size")
 
         if archive_size and isinstance(archive_size, str):
@@ -59,7 +349,7 @@ class BaseAdapter:
             except (ValueError, TypeError):
                 archive_size = None
 
-        self.enforce_size_limit(archive_size)
+        return archive_size or None
 
     def enforce_size_limit(self, size: int | None) -> None:
         """Raise if ``size`` exceeds the configured maximum archive size.
@@ -83,58 +373,228 @@ class BaseAdapter:
     def get_file_content(self, url: str | None = None) -> bytes:
         """Return the resource's content as bytes.
 
-        Locally uploaded resources are read straight from CKAN storage,
-        avoiding an authenticated HTTP request to CKAN's own download endpoint
-        (which fails for private datasets with 403). Remote resources are
-        downloaded over HTTP.
+        Prefer ``open_file_content``, which doesn't require the whole archive
+        to be held in memory.
+        """
+        with self.open_file_content(url) as fileobj:
+            return fileobj.read()
+
+    @contextmanager
+    def open_file_content(self, url: str | None = None) -> Iterator[IO[bytes]]:
+        """Yield the resource's content as a seekable file object.
+
+        Locally uploaded resources are read straight from CKAN storage (see
+        ``open_upload``). Remote resources are downloaded over HTTP into a
+        spooled buffer: it stays in memory up to the configured threshold and
+        is written to a temporary file above it. The buffer is discarded when
+        the context exits.
+
+        The size limit is enforced as the download goes (see
+        ``stream_file_content``), so an over-limit archive is never fully
+        downloaded.
+        """
+        if self.is_upload:
+            with self.open_upload() as fileobj:
+                yield fileobj
+            return
+
+        with self.stream_file_content(url) as stream, self._spool(stream) as spool:
+            yield spool
 
-        For remote downloads the size is enforced against the configured
-        maximum: the advertised Content-Length is rejected up front, and the
-        download is aborted once the bytes read exceed the limit (in case
-        Content-Length is missing or wrong), so an over-limit archive is never
-        fully loaded into memory.
+    @staticmethod
+    @contextmanager
+    def _spool(stream: IO[bytes]) -> Iterator[IO[bytes]]:
+        with SpooledTemporaryFile(
+            max_size=unf_config.get_spool_max_memory_size()
+        ) as spool:
+            shutil.copyfileobj(stream, spool, CHUNK_SIZE)
+            spool.seek(0)
+
+            yield spool
+
+    @contextmanager
+    def stream_file_content(self, url: str | None = None) -> Iterator[IO[bytes]]:
+        """Yield the resource's content as a forward-only file object.
+
+        A remote body is read from the HTTP response chunk by chunk as the
+        consumer asks for it, so memory use does not grow with the archive
+        size. The size limit is enforced against the advertised
+        Content-Length up front, and against the bytes read so far as the
+        download goes (in case Content-Length is missing or wrong).
         """
         if self.is_upload:
-            return self._read_upload()
+            with self.open_upload() as fileobj:
+                yield fileobj
+            return
 
         url = url or self.filepath
 
         try:
-            with requests.get(url, timeout=DEFAULT_TIMEOUT, stream=True) as resp:
+            with unf_session.get_session().get(
+                url, timeout=unf_session.get_timeout(), stream=True
+            ) as resp:
                 resp.raise_for_status()
 
                 self.enforce_size_limit(
                     self._content_length(resp.headers.get("content-length"))
                 )
 
-                chunks: list[bytes] = []
-                downloaded = 0
+                yield cast(
+                    IO[bytes],
+                    ChunkStream(
+                        resp.iter_content(chunk_size=CHUNK_SIZE),
+                        on_read=self.enforce_size_limit,
+                    ),
+                )
+        except requests.RequestException as e:
+            raise unf_exception.UnfoldError(f"Error fetching archive: {e}") from e
+
+    @contextmanager
+    def open_range_file(
+        self, url: str | None = None, max_blocks: int | None = 32
+    ) -> Iterator[IO[bytes] | None]:
+        """Yield a seekable file object that reads a remote file via Range requests.
+
+        Lets adapters parse formats with in-place metadata (headers spread
+        through the file, an index at a known offset) by fetching only the
+        bytes the parser actually reads. The first block is fetched up front
+        to learn whether the server honors ``Range`` and how big the file is;
+        ``None`` is yielded when it does not, and the caller is expected to
+        fall back to a full download. Uploads get the handle from
+        ``open_upload``, which is seekable and lazy as well.
+
+        ``max_blocks`` bounds the number of cached blocks; ``None`` keeps
+        everything that was read, for formats that only ever read metadata.
+        """
+        if self.is_upload:
+            with self.open_upload() as fileobj:
+                yield fileobj
+            return
 
-                for chunk in resp.iter_content(chunk_size=65536):
-                    downloaded += len(chunk)
-                    self.enforce_size_limit(downloaded)
-                    chunks.append(chunk)
+        url = url or self.filepath
+        total = None
+        head = b""
+
+        try:
+            with unf_session.get_session().get(
+                url,
+                headers={"Range": f"bytes=0-{RANGE_BLOCK_SIZE - 1}"},
+                timeout=unf_session.get_timeout(),
+                stream=True,
+            ) as resp:
+                # A full 200 response or a 416 means ranges are not supported;
+                # the body is left unread.
+                if resp.status_code == requests.codes.partial_content:
+                    total = self._total_size_from_content_range(
+                        resp.headers.get("content-range")
+                    )
+                elif resp.status_code != requests.codes.requested_range_not_satisfiable:
+                    resp.raise_for_status()
+
+                if total is not None:
+                    self.enforce_size_limit(total)
+                    head = resp.content
         except requests.RequestException as e:
             raise unf_exception.UnfoldError(f"Error fetching archive: {e}") from e
 
-        return b"".join(chunks)
+        if total is None:
+            yield None
+            return
+
+        fileobj = RangeFile(
+            lambda start, end: self._fetch_range(url, start, end),
+            total,
+            block_size=RANGE_BLOCK_SIZE,
+            max_blocks=max_blocks,
+        )
+        fileobj.prefetch(0, head)
 
-    def _read_upload(self) -> bytes:
-        """Read a locally uploaded resource's bytes via CKAN storage.
+        yield cast(IO[bytes], fileobj)
+
+    def _fetch_range(self, url: str, start: int, end: int) -> bytes:
+        """Fetch bytes ``start..end`` (inclusive) of a remote file."""
+        try:
+            with unf_session.get_session().get(
+                url,
+                headers={"Range": f"bytes={start}-{end}"},
+                timeout=unf_session.get_timeout(),
+                stream=True,
+            ) as resp:
+                resp.raise_for_status()
+
+                if resp.status_code != requests.codes.partial_content:
+                    raise unf_exception.UnfoldError(
+                        "Error fetching archive: server stopped honoring ranges"
+                    )
+
+                return resp.content
+        except requests.RequestException as e:
+            raise unf_exception.UnfoldError(f"Error fetching archive: {e}") from e
+
+    @contextmanager
+    def open_upload(self) -> Iterator[IO[bytes]]:
+        """Yield a seekable file object over a locally uploaded resource.
+
+        The file is read straight from CKAN storage, avoiding an authenticated
+        HTTP request to CKAN's own download endpoint (which fails for private
+        datasets with 403), and without loading it into memory:
+
+        * a file on the local filesystem is memory-mapped, so only the pages
+          a parser touches are read;
+        * storages that support ranged reads are read block by block, on
+          demand;
+        * any other storage is streamed into a spooled buffer.
 
         The size is already enforced up front against the resource metadata in
         ``validate_size_limit``.
         """
         upload = uploader.get_resource_uploader(self.resource)
-        location = upload.get_path(self.resource["id"])
+        storage = upload.storage
+        data = files.FileData(upload.get_path(self.resource["id"]))
 
         try:
-            return upload.storage.content(files.FileData(location))
+            with ExitStack() as stack:
+                yield self._open_upload(storage, data, stack)
         except files.exc.FilesError as e:
             raise unf_exception.UnfoldError(
                 f"Error reading uploaded archive: {e}"
             ) from e
 
+    def _open_upload(
+        self, storage: files.Storage, data: files.FileData, stack: ExitStack
+    ) -> IO[bytes]:
+        if storage.supports(files.Capability.RANGE):
+            size = self._resource_size() or storage.analyze(data.location).size
+
+            fileobj = RangeFile(
+                lambda start, end: b"".join(storage.range(data, start, end + 1)),
+                size,
+                block_size=RANGE_BLOCK_SIZE,
+            )
+
+            return cast(IO[bytes], stack.enter_context(fileobj))
+
+        content = storage.stream(data)
+
+        if hasattr(content, "close"):
+            stack.callback(content.close)  # type: ignore
+
+        try:
+            fileno = content.fileno()  # type: ignore
+        except (AttributeError, OSError):
+            # not backed by a local file
+            pass
+        else:
+            try:
+                return cast(IO[bytes], stack.enter_context(MappedFile(fileno)))
+            except (OSError, ValueError):
+                # e.g. an empty file, which can't be mapped
+                return content  # type: ignore
+
+        stream = cast(IO[bytes], ChunkStream(content))
+
+        return stack.enter_context(self._spool(stream))
+
     @staticmethod
     def _content_length(content_length: str | None) -> int | None:
         """Parse a Content-Length header value into an int."""
@@ -143,6 +603,42 @@ class BaseAdapter:
 
         return None
 
+    @staticmethod
+    def _total_size_from_content_range(content_range: str | None) -> int | None:
+        """Extract the total file size from a Content-Range header value.
+
+        e.g. "bytes 200-1023/1024" -> 1024.
+        """
+        if not content_range or "/" not in content_range:
+            return None
+
+        total = content_range.rsplit("/", 1)[-1].strip()
+
+        return int(total) if total.isdigit() else None
+
+    def get_entries(self) -> Iterable[unf_types.Entry] | None:
+        """Return the members of the archive, to build the tree from.
+
+        Only the raw path, type, size and date of each member are needed:
+        the tree, with any directories the archive doesn't list itself, is
+        built from them by ``TreeBuilder``. Adapters that build the nodes
+        themselves implement ``get_node_list`` instead and return ``None``.
+        """
+        return None
+
     def get_node_list(self) -> list[unf_types.Node]:
         """Return list of nodes representing the file structure."""
         raise NotImplementedError
+
+
+def _normalize_url(url: str) -> str:
+    """Drop the parts of a URL that don't change the resource it locates.
+
+    The scheme and host are case-insensitive, and the fragment is never
+    sent to the server.
+    """
+    parts = urlsplit(url)
+
+    return urlunsplit(
+        (parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.query, "")
+    )
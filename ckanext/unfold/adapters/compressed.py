@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import io
+import logging
+import struct
+from typing import IO
+from urllib.parse import urlparse
+
+import zstandard
+
+import ckanext.unfold.exception as unf_exception
+import ckanext.unfold.types as unf_types
+import ckanext.unfold.utils as unf_utils
+from ckanext.unfold.adapters.base import BaseAdapter
+
+log = logging.getLogger(__name__)
+
+# Enough for the fixed part of any header below, and for the original file
+# name stored in a gzip header.
+HEADER_SIZE = 4096
+
+# magic, compression method, flags, modification time, extra flags, OS
+GZIP_HEADER = struct.Struct("<2sBBIBB")
+GZIP_FEXTRA = 0x04
+GZIP_FNAME = 0x08
+# ISIZE, the uncompressed size modulo 2**32
+GZIP_TRAILER = struct.Struct("<I")
+
+
+class CompressedFileAdapter(BaseAdapter):
+    """A single file compressed on its own, e.g. ``data.csv.gz``.
+
+    It is shown as the one file it decompresses to. The name, size and date
+    of that file are taken from the header and the trailer of the
+    compressed file where the format records them, so the compressed data
+    itself is never read. Anything the format doesn't record is left
+    unknown.
+    """
+
+    extension: str = ""
+    magic: bytes = b""
+    trailer_size: int = 0
+
+    def get_entries(self) -> list[unf_types.Entry]:
+        with self.open_range_file(max_blocks=None) as fileobj:
+            if fileobj is not None:
+                head = self._read(fileobj, HEADER_SIZE)
+                total = fileobj.seek(0, io.SEEK_END)
+                tail = b""
+
+                if self.trailer_size and total >= len(self.magic) + self.trailer_size:
+                    fileobj.seek(total - self.trailer_size)
+                    tail = self._read(fileobj, self.trailer_size)
+
+                return [self._get_entry(head, tail, total)]
+
+        # without ranges the trailer can't be reached short of downloading
+        # the whole file, so only the header is read
+        with self.stream_file_content() as stream:
+            return [self._get_entry(self._read(stream, HEADER_SIZE), b"", None)]
+
+    def read_metadata(
+        self, head: bytes, tail: bytes, total: int | None
+    ) -> tuple[str | None, int | None, int | None]:
+        """Return the name, size and modification time of the original file.
+
+        ``head`` is the start of the compressed file, and ``tail`` is its
+        last ``trailer_size`` bytes, or empty if they couldn't be fetched.
+        """
+        return None, None, None
+
+    def _get_entry(
+        self, head: bytes, tail: bytes, total: int | None
+    ) -> unf_types.Entry:
+        if not head.startswith(self.magic):
+            raise unf_exception.UnfoldError(
+                f"Error opening archive: not a {self.extension} file"
+            )
+
+        name, size, modified_at = self.read_metadata(head, tail, total)
+
+        return unf_types.Entry(
+            unf_utils.name_from_path(name) or self._default_name(),
+            False,
+            size,
+            modified_at,
+            total,
+        )
+
+    def _default_name(self) -> str:
+        """Name the file after the archive, without the compression suffix."""
+        name = unf_utils.name_from_path(urlparse(self.filepath).path)
+        suffix = f".{self.extension}"
+
+        if name.lower().endswith(suffix) and len(name) > len(suffix):
+            name = name[: -len(suffix)]
+
+        return name or self.resource["id"]
+
+    @staticmethod
+    def _read(fileobj: IO[bytes], size: int) -> bytes:
+        """Read up to ``size`` bytes, from a stream that may return less."""
+        chunks = []
+
+        while size > 0 and (chunk := fileobj.read(size)):
+            chunks.append(chunk)
+            size -= len(chunk)
+
+        return b"".join(chunks)
+
+
+class GzipAdapter(CompressedFileAdapter):
+    extension = "gz"
+    magic = b"\x1f\x8b"
+    trailer_size = GZIP_TRAILER.size
+
+    def read_metadata(
+        self, head: bytes, tail: bytes, total: int | None
+    ) -> tuple[str | None, int | None, int | None]:
+        if len(head) < GZIP_HEADER.size:
+            raise unf_exception.UnfoldError("Error opening archive: truncated file")
+
+        _, _, flags, mtime, _, _ = GZIP_HEADER.unpack_from(head)
+        name = None
+
+        if flags & GZIP_FNAME:
+            pos = GZIP_HEADER.size
+
+            if flags & GZIP_FEXTRA:
+                pos += 2 + int.from_bytes(head[pos : pos + 2], "little")
+
+            end = head.find(b"\0", pos)
+
+            if end >= 0:
+                name = head[pos:end].decode("latin-1")
+
+        # ISIZE wraps around for files of 4GiB and more, which is certain
+        # once the compressed file is that big. It also describes only the
+        # last member of a file made of several concatenated ones.
+        size = None
+
+        if tail and total is not None and total < 2**32:
+            (size,) = GZIP_TRAILER.unpack(tail)
+
+        return name, size, mtime or None
+
+
+class ZstdAdapter(CompressedFileAdapter):
+    """A zstd-compressed file.
+
+    The size is recorded in the frame header by default (and always by
+    ``zstd`` itself when compressing a file), but only for the first frame:
+    files made of several frames, e.g. by ``pzstd``, report the size of the
+    first one.
+    """
+
+    extension = "zst"
+    magic = b"\x28\xb5\x2f\xfd"
+
+    def read_metadata(
+        self, head: bytes, tail: bytes, total: int | None
+    ) -> tuple[str | None, int | None, int | None]:
+        try:
+            size = zstandard.get_frame_parameters(head).content_size
+        except zstandard.ZstdError as e:
+            raise unf_exception.UnfoldError(f"Error opening archive: {e}") from e
+
+        return None, None if size == zstandard.CONTENTSIZE_UNKNOWN else size, None
+
+
+class XzAdapter(CompressedFileAdapter):
+    extension = "xz"
+    magic = b"\xfd7zXZ\x00"
+
+
+class Bz2Adapter(CompressedFileAdapter):
+    extension = "bz2"
+    magic = b"BZh"
@@ -2,15 +2,11 @@ from __future__ import annotations
 
 import logging
 from datetime import datetime as dt
-from io import BytesIO
-from typing import Any
 
 import rarfile
 from rarfile import Error as RarError
 from rarfile import RarInfo
 
-import ckan.plugins.toolkit as tk
-
 import ckanext.unfold.exception as unf_exception
 import ckanext.unfold.types as unf_types
 import ckanext.unfold.utils as unf_utils
@@ -20,7 +16,7 @@ log = logging.getLogger(__name__)
 
 
 class RarAdapter(BaseAdapter):
-    def get_node_list(self) -> list[unf_types.Node]:
+    def get_entries(self) -> list[unf_types.Entry]:
         try:
             file_list = self.get_file_list_from_url(self.filepath)
         except RarError as e:
@@ -31,61 +27,43 @@ class RarAdapter(BaseAdapter):
                 "Error. The archive is either empty or the password is incorrect."
             )
 
-        return [self._build_node(entry) for entry in file_list]
+        return [
+            unf_types.Entry(
+                entry.filename or "",
+                entry.isdir(),
+                entry.file_size,
+                self._fetch_mtime(entry),
+                entry.compress_size,
+            )
+            for entry in file_list
+        ]
 
     def get_file_list_from_url(self, url: str) -> list[RarInfo]:
         """Download an archive and fetch a file list.
 
         Rar file doesn't allow us to download it partially and fetch only file list.
         """
-        content = self.get_file_content(url)
-
-        archive = rarfile.RarFile(BytesIO(content))
-
-        needs_password = archive.needs_password()
-
-        if needs_password and not self.resource_view.get("archive_pass"):
-            raise unf_exception.UnfoldError("Error. Archive is protected with password")
-
-        if needs_password:
-            archive.setpassword(self.resource_view["archive_pass"])
-
-        return archive.infolist()
-
-    def _build_node(self, entry: RarInfo) -> unf_types.Node:
-        filename = entry.filename or ""
-        parts = [p for p in filename.split("/") if p]
-        name = unf_utils.name_from_path(filename)
-        fmt = "" if entry.isdir() else unf_utils.get_format_from_name(name)
-
-        return unf_types.Node(
-            id=filename.rstrip("/") or "",
-            text=unf_utils.name_from_path(filename),
-            icon="fa fa-folder" if entry.isdir() else unf_utils.get_icon_by_format(fmt),
-            state={"opened": True},
-            parent="/".join(parts[:-1]) if parts[:-1] else "#",
-            data=self._prepare_table_data(entry),
-        )
-
-    def _prepare_table_data(self, entry: RarInfo) -> dict[str, Any]:
-        return {
-            "size": (
-                unf_utils.printable_file_size(entry.compress_size)
-                if entry.compress_size
-                else ""
-            ),
-            "modified_at": self._fetch_mtime(entry),
-        }
-
-    def _fetch_mtime(self, entry: RarInfo) -> str:
-        modified_at = tk.h.render_datetime(
-            entry.mtime, date_format=unf_utils.DEFAULT_DATE_FORMAT
-        )
-
-        if not modified_at and isinstance(entry.date_time, tuple):
-            modified_at = tk.h.render_datetime(
-                dt(*entry.date_time),  # type: ignore
-                date_format=unf_utils.DEFAULT_DATE_FORMAT,
-            )
+        with self.open_file_content(url) as fileobj:
+            archive = rarfile.RarFile(fileobj)
+
+            needs_password = archive.needs_password()
+
+            if needs_password and not self.resource_view.get("archive_pass"):
+                raise unf_exception.UnfoldError(
+                    "Error. Archive is protected with password"
+                )
+
+            if needs_password:
+                archive.setpassword(self.resource_view["archive_pass"])
+
+            return archive.infolist()
+
+    def _fetch_mtime(self, entry: RarInfo) -> int | None:
+        if entry.mtime:
+            return unf_utils.timestamp_from_datetime(entry.mtime)
+
+        if isinstance(entry.date_time, tuple):
+            date_time = dt(*entry.date_time)  # type: ignore
+            return unf_utils.timestamp_from_datetime(date_time)
 
-        return modified_at or ""
+        return None
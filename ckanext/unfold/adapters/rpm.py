@@ -1,98 +1,104 @@
 from __future__ import annotations
 
+import io
 import logging
-from io import BytesIO
-from typing import Any
+import stat
+from dataclasses import dataclass
+from collections.abc import Iterable
+from typing import IO, Any, cast
 
-from rpmfile import RPMFile, RPMInfo
+from rpmfile.errors import RPMError
+from rpmfile import headers as rpm_headers
 
 import ckanext.unfold.exception as unf_exception
 import ckanext.unfold.types as unf_types
-import ckanext.unfold.utils as unf_utils
 from ckanext.unfold.adapters.base import BaseAdapter
 
 log = logging.getLogger(__name__)
 
+# RPMFILE_GHOST: the file is owned by the package but not shipped in it
+GHOST_FILE_FLAG = 1 << 6
+
+
+@dataclass
+class RpmEntry:
+    name: str
+    size: int
+    mtime: int | None
+    isdir: bool
+
 
 class RpmAdapter(BaseAdapter):
-    def get_node_list(self) -> list[unf_types.Node]:
+    def get_entries(self) -> list[unf_types.Entry]:
         try:
             file_list = self.get_file_list_from_url(self.filepath)
-        except (NotImplementedError, KeyError) as e:
+        except (RPMError, AssertionError, KeyError, IndexError, ValueError) as e:
             raise unf_exception.UnfoldError(f"Error opening archive: {e}") from e
 
-        nodes = [self._build_node(entry) for entry in file_list]
-
-        return self._add_folder_nodes(nodes)
-
-    def _build_node(self, entry: RPMInfo) -> unf_types.Node:
-        parts = [p for p in entry.name.split("/") if p]
-        name = unf_utils.name_from_path(entry.name)
-        fmt = "folder" if entry.isdir else unf_utils.get_format_from_name(name)
-
-        return unf_types.Node(
-            id=entry.name.rstrip("/") or "",
-            text=unf_utils.name_from_path(entry.name),
-            icon="fa fa-folder" if entry.isdir else unf_utils.get_icon_by_format(fmt),
-            parent="/".join(parts[:-1]) if parts[:-1] else "#",
-            data=self._prepare_table_data(entry),
-        )
-
-    def _prepare_table_data(self, entry: RPMInfo) -> dict[str, Any]:
-        return {
-            "size": unf_utils.printable_file_size(entry.size) if entry.size else "",
-            "modified_at": "",  # rpmfile doesn't provide this info
-        }
-
-    def get_file_list_from_url(self, url: str) -> list[RPMInfo]:
-        """Download an archive and fetch a file list.
-
-        Tar file doesn't allow us to download it partially
-        and fetch only file list, because the information
-        about each file is stored at the beggining of the file
+        return [
+            unf_types.Entry(
+                entry.name, entry.isdir, 0 if entry.isdir else entry.size, entry.mtime
+            )
+            for entry in file_list
+        ]
+
+    def get_file_list_from_url(self, url: str) -> list[RpmEntry]:
+        """Fetch a file list of a package from its header.
+
+        The main header lists every file with its size, mode and mtime, so
+        the compressed cpio payload that follows it is never read. When the
+        server honors ``Range``, only the lead and the signature and main
+        headers are fetched. Otherwise the package is streamed, and the
+        download is dropped once the main header has been read.
         """
-        content = self.get_file_content(url)
-
-        return RPMFile(fileobj=BytesIO(content)).getmembers()
-
-    def _add_folder_nodes(self, nodes: list[unf_types.Node]) -> list[unf_types.Node]:
-        folder_nodes: dict[str, unf_types.Node] = {}
-
-        for node in nodes:
-            if node.parent == "#":
-                continue
-
-            self._build_parent_node(node.parent, folder_nodes)
-
-        return nodes + list(folder_nodes.values())
-
-    def _build_parent_node(
-        self, parent: str, nodes: dict[str, unf_types.Node]
-    ) -> dict[str, unf_types.Node]:
-        parts = [p for p in parent.split("/") if p]
-
-        if not parts:
-            return nodes
-
-        bottom = parent == "."
-
-        nodes.setdefault(
-            parent,
-            unf_types.Node(
-                id=parent,
-                text=parent,
-                icon="fa fa-folder",
-                parent="#" if bottom else "/".join(parts[:-1]),
-                data={
-                    "size": "",
-                    "type": "folder",
-                    "format": "",
-                    "modified_at": "--",
-                },
-            ),
-        )
-
-        if not bottom:
-            self._build_parent_node("/".join(parts[:-1]), nodes)
-
-        return nodes
+        with self.open_range_file(url, max_blocks=None) as fileobj:
+            if fileobj is not None:
+                return self._read_file_list(fileobj)
+
+        with self.stream_file_content(url) as stream:
+            # the headers are parsed with fixed-size reads
+            return self._read_file_list(io.BufferedReader(stream))  # type: ignore
+
+    @staticmethod
+    def _read_file_list(fileobj: IO[bytes]) -> list[RpmEntry]:
+        headers: dict[str, Any] = rpm_headers.get_headers(fileobj)[1]
+
+        if "basenames" in headers:
+            dirnames = _as_sequence(headers["dirnames"])
+            names = [
+                dirnames[index] + basename
+                for index, basename in zip(
+                    _as_sequence(headers["dirindexes"]),
+                    _as_sequence(headers["basenames"]),
+                )
+            ]
+        else:
+            # packages built before rpm 4.x store full paths
+            names = _as_sequence(headers.get("oldfilenames"))
+
+        sizes = _as_sequence(headers.get("longfilesizes") or headers.get("filesizes"))
+        mtimes = _as_sequence(headers.get("filemtimes"))
+        modes = _as_sequence(headers.get("filemodes"))
+        flags = _as_sequence(headers.get("fileflags"))
+
+        return [
+            RpmEntry(
+                name=names[i].decode("utf-8", "replace").strip("/"),
+                size=sizes[i] if i < len(sizes) else 0,
+                mtime=(mtimes[i] or None) if i < len(mtimes) else None,
+                isdir=stat.S_ISDIR(modes[i]) if i < len(modes) else False,
+            )
+            for i in range(len(names))
+            if not (i < len(flags) and flags[i] & GHOST_FILE_FLAG)
+        ]
+
+
+def _as_sequence(value: Any) -> tuple[Any, ...]:
+    """Normalize a header tag value, as single-value tags are not wrapped."""
+    if value is None:
+        return ()
+
+    if isinstance(value, (tuple, list)):
+        return tuple(cast(Iterable[Any], value))
+
+    return (value,)
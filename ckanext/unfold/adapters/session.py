@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import ckanext.unfold.config as unf_config
+
+RETRY_BACKOFF_FACTOR = 0.5
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# number of distinct hosts to keep connection pools for
+POOL_CONNECTIONS = 10
+
+_lock = threading.Lock()
+_local = threading.local()
+_adapter: HTTPAdapter | None = None
+
+
+def get_session() -> requests.Session:
+    """Return a session for fetching remote archives.
+
+    Every thread gets its own session, as ``requests.Session`` isn't
+    thread-safe, but all of them share one transport adapter, so keep-alive
+    connections are pooled per host for the whole process.
+    """
+    session: requests.Session | None = getattr(_local, "session", None)
+
+    if session is None:
+        session = requests.Session()
+        adapter = _get_adapter()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _local.session = session
+
+    return session
+
+
+def get_timeout() -> tuple[int, int]:
+    """Return the (connect, read) timeout for fetching remote archives."""
+    return unf_config.get_http_timeout()
+
+
+def _get_adapter() -> HTTPAdapter:
+    global _adapter
+
+    with _lock:
+        if _adapter is None:
+            _adapter = HTTPAdapter(
+                pool_connections=POOL_CONNECTIONS,
+                pool_maxsize=unf_config.get_http_pool_maxsize(),
+                max_retries=Retry(
+                    total=unf_config.get_http_max_retries(),
+                    backoff_factor=RETRY_BACKOFF_FACTOR,
+                    status_forcelist=RETRY_STATUSES,
+                    allowed_methods=frozenset({"GET", "HEAD"}),
+                    raise_on_status=False,
+                ),
+            )
+
+    return _adapter
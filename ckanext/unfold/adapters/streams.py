@@ -0,0 +1,249 @@
+from __future__ import annotations
+
+import io
+import mmap
+from collections.abc import Callable, Iterable, Iterator
+from typing import Any
+
+
+class ChunkStream(io.RawIOBase):
+    """A forward-only, read-only file object over an iterable of byte chunks.
+
+    Lets stream-oriented readers (e.g. ``tarfile`` in ``r|*`` modes) consume
+    an HTTP body chunk by chunk, so the payload is never held in memory as a
+    whole. ``on_read`` is called with the running total of consumed bytes,
+    which adapters use to enforce the size limit mid-download.
+    """
+
+    def __init__(
+        self,
+        chunks: Iterable[bytes],
+        on_read: Callable[[int], Any] | None = None,
+    ) -> None:
+        super().__init__()
+        self._chunks: Iterator[bytes] = iter(chunks)
+        self._on_read = on_read
+        self._buffer = memoryview(b"")
+        self._consumed = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._consumed - len(self._buffer)
+
+    def readinto(self, buffer: Any) -> int:
+        while not self._buffer:
+            chunk = next(self._chunks, None)
+
+            if chunk is None:
+                return 0
+
+            self._consumed += len(chunk)
+
+            if self._on_read:
+                self._on_read(self._consumed)
+
+            self._buffer = memoryview(chunk)
+
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+
+        return size
+
+
+class RangeFile(io.RawIOBase):
+    """A seekable, read-only file object backed by ranged reads.
+
+    ``fetch(start, end)`` must return the bytes at ``start..end`` (inclusive)
+    of a file of ``size`` bytes. Reads are served from block-aligned chunks:
+    a read pulls in the whole block(s) around it, so nearby reads (e.g.
+    consecutive small archive headers) are batched into a single fetch, and
+    consecutive missing blocks are requested together. Only the
+    ``max_blocks`` most recently used blocks are kept (all of them if
+    ``None``), so seeking through a huge file does not accumulate it in
+    memory.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[int, int], bytes],
+        size: int,
+        block_size: int = 65536,
+        max_blocks: int | None = 32,
+    ) -> None:
+        super().__init__()
+        self._fetch = fetch
+        self._size = size
+        self._block_size = block_size
+        self._max_blocks = max_blocks
+        self._blocks: dict[int, bytes] = {}
+        self._pos = 0
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self._size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+
+        if pos < 0:
+            raise OSError(f"Negative seek position {pos}")
+
+        self._pos = pos
+        return pos
+
+    def prefetch(self, offset: int, data: bytes) -> None:
+        """Seed the block cache with already known bytes starting at ``offset``.
+
+        Only whole blocks are kept, plus the final partial block of the file.
+        """
+        first = -(-offset // self._block_size)
+        last = (offset + len(data)) // self._block_size
+
+        for block in range(first, last + 1):
+            start = block * self._block_size - offset
+            chunk = data[start : start + self._block_size]
+
+            if len(chunk) == self._block_length(block):
+                self._store(block, chunk)
+
+    def readinto(self, buffer: Any) -> int:
+        end = min(self._pos + len(buffer), self._size)
+
+        if end <= self._pos:
+            return 0
+
+        data = self._read_range(self._pos, end)
+        buffer[: len(data)] = data
+        self._pos += len(data)
+
+        return len(data)
+
+    def _read_range(self, start: int, end: int) -> bytes:
+        first = start // self._block_size
+        last = (end - 1) // self._block_size
+
+        if first == last and first in self._blocks:
+            offset = start - first * self._block_size
+            return self._blocks[first][offset : offset + end - start]
+
+        blocks = {
+            b: self._blocks[b] for b in range(first, last + 1) if b in self._blocks
+        }
+        missing = [b for b in range(first, last + 1) if b not in blocks]
+
+        # fetch every run of consecutive missing blocks with a single request
+        while missing:
+            run = 1
+            while run < len(missing) and missing[run] == missing[0] + run:
+                run += 1
+
+            blocks.update(self._fetch_blocks(missing[0], missing[run - 1]))
+            missing = missing[run:]
+
+        for block, content in blocks.items():
+            self._store(block, content)
+
+        data = b"".join(blocks[b] for b in range(first, last + 1))
+        offset = start - first * self._block_size
+
+        return data[offset : offset + end - start]
+
+    def _fetch_blocks(self, first: int, last: int) -> dict[int, bytes]:
+        start = first * self._block_size
+        end = min((last + 1) * self._block_size, self._size) - 1
+        data = self._fetch(start, end)
+
+        if len(data) != end - start + 1:
+            raise OSError(
+                f"Short read: expected {end - start + 1} bytes at {start}, "
+                f"got {len(data)}"
+            )
+
+        return {
+            block: data[
+                (block - first) * self._block_size : (block - first + 1)
+                * self._block_size
+            ]
+            for block in range(first, last + 1)
+        }
+
+    def _block_length(self, block: int) -> int:
+        return min(self._block_size, self._size - block * self._block_size)
+
+    def _store(self, block: int, data: bytes) -> None:
+        self._blocks.pop(block, None)
+        self._blocks[block] = data
+
+        while self._max_blocks is not None and len(self._blocks) > self._max_blocks:
+            del self._blocks[next(iter(self._blocks))]
+
+
+class MappedFile(io.RawIOBase):
+    """A seekable, read-only file object over a memory-mapped local file.
+
+    Only the pages a reader actually touches are loaded, so parsers that
+    seek to an index (e.g. the ZIP central directory) never pull in the rest
+    of the file. The mapping is closed together with the file object.
+    """
+
+    def __init__(self, fileno: int) -> None:
+        super().__init__()
+        self._map = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._map) + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+
+        if pos < 0:
+            raise OSError(f"Negative seek position {pos}")
+
+        self._pos = pos
+        return pos
+
+    def readinto(self, buffer: Any) -> int:
+        data = self._map[self._pos : self._pos + len(buffer)]
+        buffer[: len(data)] = data
+        self._pos += len(data)
+
+        return len(data)
+
+    def close(self) -> None:
+        if not self.closed:
+            self._map.close()
+
+        super().close()
@@ -1,67 +1,87 @@
 from __future__ import annotations
 
 import logging
-from datetime import datetime as dt
-from io import BytesIO
-from tarfile import TarError, TarInfo, open as tar_open
-from typing import Any, Literal
+from collections.abc import Iterator
+from tarfile import ReadError, TarError, TarFile, TarInfo, open as tar_open
+from typing import IO, Literal
 
-
-import ckan.plugins.toolkit as tk
+import zstandard
 
 import ckanext.unfold.exception as unf_exception
 import ckanext.unfold.types as unf_types
-import ckanext.unfold.utils as unf_utils
 from ckanext.unfold.adapters.base import BaseAdapter
 
 log = logging.getLogger(__name__)
 
+# Plain ``r`` keeps tarfile's transparent compression detection.
+STREAM_MODES: dict[str, Literal["r|*", "r|gz", "r|xz", "r|bz2"]] = {
+    "r": "r|*",
+    "r:gz": "r|gz",
+    "r:xz": "r|xz",
+    "r:bz2": "r|bz2",
+}
+
 
 class TarAdapter(BaseAdapter):
     mode: Literal["r", "r:gz", "r:xz", "r:bz2"] = "r"
 
-    def get_node_list(self) -> list[unf_types.Node]:
+    def get_entries(self) -> Iterator[unf_types.Entry]:
         try:
-            file_list = self.get_file_list_from_url(self.filepath)
+            for entry in self.get_file_list_from_url(self.filepath):
+                yield unf_types.Entry(
+                    entry.name, entry.isdir(), entry.size, int(entry.mtime)
+                )
         except TarError as e:
             raise unf_exception.UnfoldError(f"Error opening archive: {e}") from e
 
-        return [self._build_node(entry) for entry in file_list]
-
-    def _build_node(self, entry: TarInfo) -> unf_types.Node:
-        parts = [p for p in entry.name.split("/") if p]
-        name = unf_utils.name_from_path(entry.name)
-        fmt = "folder" if entry.isdir() else unf_utils.get_format_from_name(name)
-
-        return unf_types.Node(
-            id=entry.name.rstrip("/") or "",
-            text=unf_utils.name_from_path(entry.name),
-            icon="fa fa-folder" if entry.isdir() else unf_utils.get_icon_by_format(fmt),
-            state={"opened": True},
-            parent="/".join(parts[:-1]) if parts[:-1] else "#",
-            data=self._prepare_table_data(entry),
-        )
-
-    def _prepare_table_data(self, entry: TarInfo) -> dict[str, Any]:
-        modified_at = tk.h.render_datetime(
-            dt.fromtimestamp(entry.mtime), date_format=unf_utils.DEFAULT_DATE_FORMAT
-        )
-
-        return {
-            "size": unf_utils.printable_file_size(entry.size) if entry.size else "",
-            "modified_at": modified_at or "",
-        }
-
-    def get_file_list_from_url(self, url: str) -> list[TarInfo]:
-        """Download an archive and fetch a file list.
-
-        Tar file doesn't allow us to download it partially
-        and fetch only file list, because the information
-        about each file is stored at the beginning of the file
+    @property
+    def stream_mode(self) -> Literal["r|*", "r|gz", "r|xz", "r|bz2"]:
+        """Tarfile stream mode matching ``mode``, e.g. ``r:gz`` -> ``r|gz``."""
+        return STREAM_MODES[self.mode]
+
+    def get_file_list_from_url(self, url: str) -> Iterator[TarInfo]:
+        """Yield archive members as their headers are parsed.
+
+        Tar stores the information about each file right before its data.
+        For an uncompressed archive on a server that honors ``Range``, only
+        the 512-byte headers are fetched and the member data in between is
+        seeked over. Otherwise the whole archive is read in tarfile's stream
+        mode: member data is skipped as it flows past and never buffered, so
+        peak memory stays flat regardless of the archive size.
+        """
+        if self.mode == "r":
+            with self.open_range_file(url) as fileobj:
+                archive = self._open_ranged(fileobj) if fileobj else None
+
+                if archive:
+                    with archive:
+                        yield from self._iter_members(archive)
+                    return
+
+        with (
+            self.stream_file_content(url) as stream,
+            tar_open(fileobj=stream, mode=self.stream_mode) as archive,
+        ):
+            yield from self._iter_members(archive)
+
+    @staticmethod
+    def _open_ranged(fileobj: IO[bytes]) -> TarFile | None:
+        """Open an uncompressed archive for random access.
+
+        Returns ``None`` if the file is not a plain tar (e.g. a compressed
+        archive labelled as ``tar``), which the stream mode can still detect.
         """
-        content = self.get_file_content(url)
+        try:
+            return tar_open(fileobj=fileobj, mode="r:")
+        except ReadError:
+            return None
 
-        return tar_open(fileobj=BytesIO(content), mode=self.mode).getmembers()
+    @staticmethod
+    def _iter_members(archive: TarFile) -> Iterator[TarInfo]:
+        while (entry := archive.next()) is not None:
+            yield entry
+            # TarFile remembers every member it has read
+            archive.members.clear()  # type: ignore
 
 
 class TarGzAdapter(TarAdapter):
@@ -74,3 +94,26 @@ class TarXzAdapter(TarAdapter):
 
 class TarBz2Adapter(TarAdapter):
     mode = "r:bz2"
+
+
+class TarZstAdapter(TarAdapter):
+    """A zstd-compressed tar archive, which ``tarfile`` can't decompress.
+
+    The archive is decompressed by ``zstandard`` as it is downloaded and the
+    members are read from the decompressed stream in tarfile's stream mode.
+    The decompressor only keeps its window in memory, capped at 128MiB by
+    default, so peak memory stays flat regardless of the archive size.
+    """
+
+    def get_file_list_from_url(self, url: str) -> Iterator[TarInfo]:
+        try:
+            with (
+                self.stream_file_content(url) as stream,
+                zstandard.ZstdDecompressor().stream_reader(
+                    stream, read_across_frames=True, closefd=False
+                ) as reader,
+                tar_open(fileobj=reader, mode="r|") as archive,
+            ):
+                yield from self._iter_members(archive)
+        except zstandard.ZstdError as e:
+            raise unf_exception.UnfoldError(f"Error opening archive: {e}") from e
@@ -1,94 +1,133 @@
 from __future__ import annotations
 
 import logging
+import struct
 from datetime import datetime as dt
 from io import BytesIO
-from typing import Any
-from zipfile import ZIP_STORED, BadZipFile, LargeZipFile, ZipFile, ZipInfo
+from zipfile import BadZipFile, LargeZipFile, ZipFile, ZipInfo
 
 import requests
 
-import ckan.plugins.toolkit as tk
-
 import ckanext.unfold.exception as unf_exception
 import ckanext.unfold.types as unf_types
 import ckanext.unfold.utils as unf_utils
-from ckanext.unfold.adapters.base import DEFAULT_TIMEOUT, BaseAdapter
+from ckanext.unfold.adapters import session as unf_session
+from ckanext.unfold.adapters.base import BaseAdapter
 
 log = logging.getLogger(__name__)
 
 # A ZIP central directory lives at the end of the file, so we only fetch the
 # tail. 64KiB covers the EOCD record (its comment is capped at 65535 bytes)
-# plus the central directory of most archives; larger directories grow the
-# window on demand.
+# plus the central directory of most archives; for larger directories the
+# EOCD record tells exactly which bytes are still missing.
 INITIAL_TAIL_SIZE = 65536
-TAIL_GROWTH_FACTOR = 4
+
+# End of central directory record, and its Zip64 locator and record
+EOCD = struct.Struct("<4s4H2LH")
+EOCD_SIGNATURE = b"PK\x05\x06"
+ZIP64_LOCATOR = struct.Struct("<4sLQL")
+ZIP64_LOCATOR_SIGNATURE = b"PK\x06\x07"
+ZIP64_EOCD = struct.Struct("<4sQ2H2L4Q")
+ZIP64_EOCD_SIGNATURE = b"PK\x06\x06"
 
 
 class ZipAdapter(BaseAdapter):
-    def get_node_list(self) -> list[unf_types.Node]:
+    def get_entries(self) -> list[unf_types.Entry]:
         try:
             if self.is_upload:
-                file_list = ZipFile(BytesIO(self.get_file_content())).infolist()
+                with self.open_file_content() as fileobj:
+                    file_list = ZipFile(fileobj).infolist()
             else:
                 file_list = self.get_file_list_from_url(self.filepath)
         except (LargeZipFile, BadZipFile) as e:
             raise unf_exception.UnfoldError(f"Error opening archive: {e}") from e
 
-        return [self._build_node(entry) for entry in self.ensure_dir_entries(file_list)]
+        return [
+            unf_types.Entry(
+                entry.filename,
+                entry.is_dir(),
+                entry.file_size,
+                unf_utils.timestamp_from_datetime(dt(*entry.date_time)),
+                entry.compress_size,
+            )
+            for entry in file_list
+        ]
 
     def get_file_list_from_url(self, url: str) -> list[ZipInfo]:
         """Read the ZIP central directory from a remote URL.
 
         Only the tail of the archive is downloaded via an HTTP suffix range.
-        If the central directory is larger than the fetched tail, the window
-        is grown and re-fetched until it parses or the whole file is read.
+        The EOCD record (or its Zip64 counterpart) in the tail states where
+        the central directory starts; if that is before the fetched tail, the
+        missing bytes, and only those, are fetched with one more request.
         Servers that ignore ``Range`` return the full file, which is parsed
         as-is.
         """
-        size = INITIAL_TAIL_SIZE
-
-        while True:
-            content, total, ranged = self._fetch_tail(url, size)
-
-            try:
-                return ZipFile(BytesIO(content)).infolist()
-            except BadZipFile:
-                # A truncated central directory raises BadZipFile. Grow the
-                # window unless we already hold the entire file.
-                if not ranged or len(content) >= total or size >= total:
-                    raise
-
-                size = min(size * TAIL_GROWTH_FACTOR, total)
-
-    def _build_node(self, entry: ZipInfo) -> unf_types.Node:
-        parts = [p for p in entry.filename.split("/") if p]
-        name = unf_utils.name_from_path(entry.filename)
-        fmt = "folder" if entry.is_dir() else unf_utils.get_format_from_name(name)
-
-        return unf_types.Node(
-            id=entry.filename.rstrip("/") or "",
-            text=unf_utils.name_from_path(entry.filename),
-            icon=(
-                "fa fa-folder" if entry.is_dir() else unf_utils.get_icon_by_format(fmt)
-            ),
-            state={"opened": True},
-            parent="/".join(parts[:-1]) if parts[:-1] else "#",
-            data=self._prepare_table_data(entry),
-        )
-
-    def _prepare_table_data(self, entry: ZipInfo) -> dict[str, Any]:
-        return {
-            "size": (
-                unf_utils.printable_file_size(entry.compress_size)
-                if entry.compress_size
-                else ""
-            ),
-            "modified_at": tk.h.render_datetime(
-                dt(*entry.date_time), date_format=unf_utils.DEFAULT_DATE_FORMAT
-            )
-            or "",
-        }
+        content, total, ranged = self._fetch_tail(url, INITIAL_TAIL_SIZE)
+        tail_start = total - len(content)
+
+        if ranged and tail_start > 0:
+            start = self._central_directory_start(url, content, tail_start)
+
+            if start is not None and start < tail_start:
+                content = self._fetch_range(url, start, tail_start - 1) + content
+
+        return ZipFile(BytesIO(content)).infolist()
+
+    def _central_directory_start(
+        self, url: str, tail: bytes, tail_start: int
+    ) -> int | None:
+        """Return the absolute offset of the central directory.
+
+        The directory immediately precedes the (Zip64) EOCD record, so its
+        start is computed from the record position and the directory size.
+        Unlike the offset stored in the record, this also holds for archives
+        with data prepended to them (e.g. self-extracting ones), which is how
+        ``zipfile`` locates it too. Returns ``None`` if the tail has no valid
+        EOCD record, leaving the error to ``zipfile``.
+        """
+        pos = self._find_eocd(tail)
+
+        if pos is None:
+            return None
+
+        cd_size = EOCD.unpack_from(tail, pos)[5]
+        record_pos = pos
+
+        locator_pos = pos - ZIP64_LOCATOR.size
+
+        if locator_pos >= 0 and tail.startswith(ZIP64_LOCATOR_SIGNATURE, locator_pos):
+            _, _, zip64_offset, _ = ZIP64_LOCATOR.unpack_from(tail, locator_pos)
+
+            # the Zip64 record normally sits right before its locator
+            record_pos = locator_pos - ZIP64_EOCD.size
+            record = tail[record_pos:locator_pos] if record_pos >= 0 else b""
+
+            if not record.startswith(ZIP64_EOCD_SIGNATURE):
+                record = self._fetch_range(
+                    url, zip64_offset, zip64_offset + ZIP64_EOCD.size - 1
+                )
+                record_pos = zip64_offset - tail_start
+
+            cd_size = ZIP64_EOCD.unpack(record)[8]
+
+        return tail_start + record_pos - cd_size
+
+    @staticmethod
+    def _find_eocd(tail: bytes) -> int | None:
+        """Find the EOCD record, whose comment must run to the end of file."""
+        pos = tail.rfind(EOCD_SIGNATURE)
+
+        while pos >= 0:
+            if pos + EOCD.size <= len(tail):
+                comment_size = EOCD.unpack_from(tail, pos)[-1]
+
+                if pos + EOCD.size + comment_size == len(tail):
+                    return pos
+
+            pos = tail.rfind(EOCD_SIGNATURE, 0, pos)
+
+        return None
 
     def _fetch_tail(self, url: str, size: int) -> tuple[bytes, int, bool]:
         """Fetch the last ``size`` bytes of a remote file.
@@ -102,10 +141,10 @@ class ZipAdapter(BaseAdapter):
         pulling its contents (relevant when the server ignores ``Range``).
         """
         try:
-            with requests.get(
+            with unf_session.get_session().get(
                 url,
                 headers={"Range": f"bytes=-{size}"},
-                timeout=DEFAULT_TIMEOUT,
+                timeout=unf_session.get_timeout(),
                 stream=True,
             ) as resp:
                 # Some servers reject a suffix range larger than the file with
@@ -143,7 +182,9 @@ class ZipAdapter(BaseAdapter):
         Returns the content, total size, and ``False`` for ``ranged``.
         """
         try:
-            with requests.get(url, timeout=DEFAULT_TIMEOUT, stream=True) as resp:
+            with unf_session.get_session().get(
+                url, timeout=unf_session.get_timeout(), stream=True
+            ) as resp:
                 resp.raise_for_status()
 
                 total = self._content_length(resp.headers.get("content-length"))
@@ -156,49 +197,3 @@ class ZipAdapter(BaseAdapter):
             ) from e
 
         return content, total if total is not None else len(content), False
-
-    @staticmethod
-    def _total_size_from_content_range(content_range: str | None) -> int | None:
-        """Extract the total file size from a Content-Range header value.
-
-        e.g. "bytes 200-1023/1024" -> 1024.
-        """
-        if not content_range or "/" not in content_range:
-            return None
-
-        total = content_range.rsplit("/", 1)[-1].strip()
-
-        return int(total) if total.isdigit() else None
-
-    def ensure_dir_entries(self, file_list: list[ZipInfo]) -> list[ZipInfo]:
-        """Ensure directory entries exist in a ZipFile infolist.
-
-        ZIP archives may omit explicit directory entries ("dir/") and only
-        contain file paths ("dir/file.txt"). Infolist() then misses those
-        directories. This function infers and adds the missing ZipInfo
-        entries so consumers can rely on a complete directory tree.
-        """
-        names = [zi.filename for zi in file_list]
-        name_set = set(names)
-
-        inferred_dirs = set()
-        for name in names:
-            # treat "dir/" as a dir and "dir/file" as a file
-            s = name[:-1] if name.endswith("/") else name
-            i = s.rfind("/")
-            while i != -1:
-                d = s[: i + 1]  # keep trailing slash to mark as dir
-                if d not in name_set:
-                    inferred_dirs.add(d)
-                i = s.rfind("/", 0, i)
-
-        if inferred_dirs:
-            for d in inferred_dirs:
-                zi = ZipInfo(d)
-                # Mark as a directory: set Unix mode drwxr-xr-x
-                zi.external_attr = 0o40755 << 16
-                zi.compress_type = ZIP_STORED
-                zi.file_size = 0
-                file_list.append(zi)
-
-        return file_list
@@ -19,11 +19,38 @@ ckan.module("unfold-init-jstree", function ($, _) {
             this.errorBlock = $("#archive-tree-error");
             this.loadState = $(".unfold-load-state");
 
-            $("#jstree-search").on("change", (e) => this.tree.jstree("search", $(e.target).val()));
+            $("#jstree-search").on("change", (e) => this._search($(e.target).val()));
             $("#jstree-search-clear").click(() => $("#jstree-search").val("").trigger("change"));
-            $("#jstree-expand-all").click(() => this.tree.jstree("open_all"));
+            $("#jstree-expand-all").click(this._expandAll);
             $("#jstree-collapse-all").click(() => this.tree.jstree("close_all"));
 
+            $.ajax({
+                url: this.sandbox.url("/api/action/get_archive_structure"),
+                data: { ...this._getPayload(), lazy: true, format: "compact" },
+                success: this._onSuccessRequest,
+            });
+        },
+
+        /**
+         * Expand every directory. Huge archives are loaded one directory at
+         * a time, and opening all of them would fetch each one with its own
+         * request, so only the directories loaded already are expanded.
+         */
+        _expandAll: function () {
+            if (!this.lazy) {
+                this.tree.jstree("open_all");
+                return;
+            }
+
+            const tree = this.tree.jstree(true);
+            const loaded = tree.get_node("#").children_d.filter(
+                (id) => tree.is_loaded(id) && !tree.is_leaf(id)
+            );
+
+            tree.open_node(loaded, null, 0);
+        },
+
+        _getPayload: function () {
             const payload = {
                 id: this.options.resourceId,
                 view_id: this.options.resourceViewId,
@@ -33,13 +60,181 @@ ckan.module("unfold-init-jstree", function ($, _) {
                 delete payload.view_id;
             }
 
+            return payload;
+        },
+
+        /**
+         * Expand a compact response of get_archive_structure into jstree
+         * nodes: rows are matched to their columns, parents and icons are
+         * looked up in their tables and ids are derived from the parent.
+         * Sizes come as raw numbers, each distinct one is formatted once.
+         * Dates are formatted by the server, in its display timezone, and
+         * looked up in their table as well. The fields some nodes set on their own, such as
+         * links, come in `extra` and are applied on top.
+         *
+         * @param {Object} result - the compact response
+         */
+        _expandCompact: function (result) {
+            const column = Object.fromEntries(result.columns.map((name, index) => [name, index]));
+            const formatSize = this._memoize(this._formatSize);
+
+            return result.rows.map((row, index) => {
+                const parent = result.parents[row[column.parent]];
+                const text = row[column.text];
+                const size = formatSize(row[column.size]);
+                const modifiedAt = result.dates[row[column.modified_at]] ?? "";
+
+                const { data, ...extra } = result.extra[index] ?? {};
+
+                return {
+                    id: result.ids[index] ?? (parent === "#" ? text : `${parent}/${text}`),
+                    text: text + this._renderMetadata(size, modifiedAt),
+                    icon: result.icons[row[column.icon]],
+                    parent: parent,
+                    state: { opened: result.opened },
+                    data: {
+                        size: size,
+                        compressed_size: formatSize(row[column.compressed_size]),
+                        modified_at: modifiedAt,
+                        file_count: row[column.file_count],
+                        ...data,
+                    },
+                    li_attr: null,
+                    a_attr: { ...result.a_attr },
+                    children: Boolean(row[column.children]),
+                    ...extra,
+                };
+            });
+        },
+
+        _memoize: function (format) {
+            const cache = new Map();
+
+            return (value) => {
+                if (typeof value !== "number") {
+                    return value || "";
+                }
+
+                if (!cache.has(value)) {
+                    cache.set(value, format(value));
+                }
+
+                return cache.get(value);
+            };
+        },
+
+        /**
+         * Format a size in bytes the way the server does, e.g. 1.5 MB.
+         *
+         * @param {Number} bytes - the size
+         */
+        _formatSize: function (bytes) {
+            if (!bytes) {
+                return "";
+            }
+
+            const units = ["B", "KB", "MB", "GB", "TB"];
+            const exponent = Math.min(Math.floor(Math.log(bytes) / Math.log(1024)), units.length - 1);
+            const value = Math.round(bytes / Math.pow(1024, exponent) * 10) / 10;
+
+            return `${value.toFixed(1)} ${units[exponent]}`;
+        },
+
+        _renderMetadata: function (size, modifiedAt) {
+            if (!size && !modifiedAt) {
+                return "";
+            }
+
+            let html = "<span class='unfold-node-metadata'>";
+
+            if (size) {
+                html += ` <span class="unfold-node-size">${size}</span>`;
+            }
+
+            if (modifiedAt) {
+                html += ` <span class="unfold-node-modified-at">${modifiedAt}</span>`;
+            }
+
+            return html + "</span>";
+        },
+
+        /**
+         * Search the tree. Huge archives are only partially loaded, so
+         * they are searched on the server and the tree shows just the
+         * matching nodes and their ancestors until the search is cleared.
+         *
+         * @param {String} query - a part of the path or a glob pattern
+         */
+        _search: function (query) {
+            if (!this.lazy) {
+                this.tree.jstree("search", query);
+                return;
+            }
+
+            if (!query) {
+                this.searchResult = null;
+                this.tree.jstree("refresh");
+                return;
+            }
+
             $.ajax({
-                url: this.sandbox.url("/api/action/get_archive_structure"),
-                data: payload,
-                success: this._onSuccessRequest,
+                url: this.sandbox.url("/api/action/search_archive_structure"),
+                data: { ...this._getPayload(), q: query },
+                success: (data) => {
+                    if (data.result.error) {
+                        this._displayErrorReason(data.result.error);
+                    } else {
+                        this.searchResult = data.result;
+                        this.tree.jstree("refresh");
+                    }
+                },
             });
         },
 
+        /**
+         * Build a jstree data callback that loads the contents of a directory
+         * when it's opened. Used for huge archives, for which the server only
+         * returns the top level.
+         *
+         * @param {Array} rootNodes - the top level nodes, already fetched
+         */
+        _getLazyLoader: function (rootNodes) {
+            const module = this;
+            // nodes are nested by jstree itself, it must not look for parents
+            const toNested = (nodes) => nodes.map(({ parent, ...node }) => node);
+
+            return function (node, callback) {
+                if (node.id === "#" && module.searchResult) {
+                    const matches = new Set(module.searchResult.matches);
+
+                    // search results are complete, so they stay in flat format
+                    callback.call(this, module.searchResult.nodes.map((n) => (
+                        matches.has(n.id) ? { ...n, a_attr: { ...n.a_attr, class: "jstree-search" } } : n
+                    )));
+                    return;
+                }
+
+                if (node.id === "#") {
+                    callback.call(this, toNested(rootNodes));
+                    return;
+                }
+
+                $.ajax({
+                    url: module.sandbox.url("/api/action/get_archive_structure"),
+                    data: { ...module._getPayload(), parent: node.id, format: "compact" },
+                    success: (data) => {
+                        if (data.result.error) {
+                            module._displayErrorReason(data.result.error);
+                            callback.call(this, []);
+                        } else {
+                            callback.call(this, toNested(module._expandCompact(data.result)));
+                        }
+                    },
+                    error: () => callback.call(this, []),
+                });
+            };
+        },
+
         _setupKeyboardNavigation: function () {
             // Handle TAB, SHIFT+TAB navigation
             this.tree.on("keydown.jstree", ".jstree-anchor", (e) => {
@@ -72,7 +267,7 @@ ckan.module("unfold-init-jstree", function ($, _) {
             if (data.result.error) {
                 this._displayErrorReason(data.result.error);
             } else {
-                this._initJsTree(data.result);
+                this._initJsTree(this._expandCompact(data.result));
             }
         },
 
@@ -83,7 +278,12 @@ ckan.module("unfold-init-jstree", function ($, _) {
         },
 
         _initJsTree: function (data) {
-            let withAnimation = data.length < this.options.animationThreshold;
+            // the server returns only the top level of huge archives, with
+            // expandable folders flagged to be loaded on demand
+            const lazy = data.some((node) => node.children === true);
+            this.lazy = lazy;
+            this.searchResult = null;
+            let withAnimation = !lazy && data.length < this.options.animationThreshold;
             let plugins = ["search", "wholerow"];
 
             if (this.options.showContextMenu) {
@@ -105,7 +305,7 @@ ckan.module("unfold-init-jstree", function ($, _) {
                 })
                 .jstree({
                     core: {
-                        data: data,
+                        data: lazy ? this._getLazyLoader(data) : data,
                         themes: { dots: false },
                         animation: withAnimation ? 200 : 0,
                         multiple: false,
@@ -161,7 +361,7 @@ ckan.module("unfold-init-jstree", function ($, _) {
                 };
             }
 
-            if (node.children.length > 0) {
+            if (!this.tree.jstree("is_leaf", node)) {
                 items["toggle"] = {
                     label: node.state.opened ? ckan.i18n._("Collapse") : ckan.i18n._("Expand"),
                     action: () => {
@@ -0,0 +1,245 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import zstandard
+
+import ckanext.unfold.types as unf_types
+from ckanext.unfold.search import PathIndex
+
+
+class MemoryCache:
+    """A thread-safe, in-process LRU cache bounded by the size of its values.
+
+    The size of each value is given by the caller (e.g. the length of its
+    serialized form), as the real footprint of Python objects can't be
+    measured cheaply. Least recently used entries are evicted once the total
+    exceeds ``max_size``; expired entries are dropped on access.
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[Any, int, float]] = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get(self, key: str) -> Any | None:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return None
+
+            value, _, expires_at = entry
+
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+
+            self._entries.move_to_end(key)
+
+            return value
+
+    def set(self, key: str, value: Any, size: int, ttl: float) -> None:
+        if size > self.max_size or ttl <= 0:
+            return
+
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = (value, size, time.monotonic() + ttl)
+            self._size += size
+
+            while self._size > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._remove(key)
+
+    def delete_prefix(self, prefix: str) -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+
+        if entry is not None:
+            self._size -= entry[1]
+
+
+class CacheFormatError(ValueError):
+    """A cache entry is not in the current format, e.g. left by an old version."""
+
+
+# Bump the version whenever the layout of the payload changes: entries in any
+# other format are rejected and rebuilt.
+FORMAT_MAGIC = b"UNF\x04"
+RESPONSE_MAGIC = b"UNR\x01"
+INDEX_MAGIC = b"UNI\x01"
+COMPRESSION_LEVEL = 3
+
+
+def encode_nodes(nodes: unf_types.NodeTable) -> bytes:
+    """Serialize an archive structure into the compact cache format.
+
+    The columns of the table are stored as they are, except that parent
+    paths and icons are interned into a single string table and referenced
+    by index, node ids are omitted when they can be derived from the parent
+    path and the name, and ``children`` is only stored for nodes where it's
+    not implied by the tree. The result is compressed with zstd, which
+    squeezes the remaining repetition out of the names.
+    """
+    strings: dict[str, int] = {}
+
+    def intern(value: str) -> int:
+        return strings.setdefault(value, len(strings))
+
+    parents = [intern(parent) for parent in nodes.parents]
+    icons = [intern(icon) for icon in nodes.icons]
+    parent_ids = set(nodes.parents)
+
+    payload = json.dumps(
+        {
+            "strings": list(strings),
+            "text": nodes.texts,
+            "parent": parents,
+            "icon": icons,
+            "table": nodes.table_columns,
+            "id": {
+                index: node_id
+                for index, (node_id, parent, text) in enumerate(
+                    zip(nodes.ids, nodes.parents, nodes.texts)
+                )
+                if node_id != _derive_id(parent, text)
+            },
+            "children": [
+                index
+                for index, (node_id, children) in enumerate(
+                    zip(nodes.ids, nodes.children)
+                )
+                if bool(children) != (node_id in parent_ids)
+            ],
+            "extra": nodes.extra,
+        },
+        separators=(",", ":"),
+    ).encode()
+
+    compressor = zstandard.ZstdCompressor(
+        level=COMPRESSION_LEVEL, write_content_size=True
+    )
+
+    return FORMAT_MAGIC + compressor.compress(payload)
+
+
+def decode_nodes(data: bytes) -> unf_types.NodeTable:
+    """Deserialize an archive structure stored by ``encode_nodes``.
+
+    Raises ``CacheFormatError`` if the entry is in any other format.
+    """
+    if not data.startswith(FORMAT_MAGIC):
+        raise CacheFormatError("Unknown cache entry format")
+
+    try:
+        payload = json.loads(
+            zstandard.ZstdDecompressor().decompress(data[len(FORMAT_MAGIC) :])
+        )
+    except (zstandard.ZstdError, ValueError) as e:
+        raise CacheFormatError(f"Corrupted cache entry: {e}") from e
+
+    strings: list[str] = payload["strings"]
+    ids: dict[str, str] = payload["id"]
+    nodes = unf_types.NodeTable()
+
+    nodes.texts = payload["text"]
+    nodes.parents = [strings[parent] for parent in payload["parent"]]
+    nodes.icons = [strings[icon] for icon in payload["icon"]]
+    nodes.ids = [
+        ids[key] if (key := str(index)) in ids else _derive_id(parent, text)
+        for index, (parent, text) in enumerate(zip(nodes.parents, nodes.texts))
+    ]
+
+    for name, column in nodes.table_columns.items():
+        column.extend(payload["table"][name])
+
+    parent_ids = set(nodes.parents)
+    nodes.children = bytearray(node_id in parent_ids for node_id in nodes.ids)
+
+    for index in payload["children"]:
+        nodes.children[index] = not nodes.children[index]
+
+    nodes.extra = {int(index): fields for index, fields in payload["extra"].items()}
+
+    return nodes
+
+
+def encode_response(response: str) -> bytes:
+    """Compress a serialized API response for storage in Redis."""
+    compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+
+    return RESPONSE_MAGIC + compressor.compress(response.encode())
+
+
+def decode_response(data: bytes) -> str:
+    """Restore a serialized API response stored by ``encode_response``.
+
+    Raises ``CacheFormatError`` if the entry is in any other format.
+    """
+    if not data.startswith(RESPONSE_MAGIC):
+        raise CacheFormatError("Unknown cache entry format")
+
+    try:
+        return (
+            zstandard.ZstdDecompressor()
+            .decompress(data[len(RESPONSE_MAGIC) :])
+            .decode()
+        )
+    except (zstandard.ZstdError, UnicodeDecodeError) as e:
+        raise CacheFormatError(f"Corrupted cache entry: {e}") from e
+
+
+def encode_index(index: PathIndex) -> bytes:
+    """Compress a path index for storage in Redis."""
+    compressor = zstandard.ZstdCompressor(level=COMPRESSION_LEVEL)
+
+    return INDEX_MAGIC + compressor.compress(index.to_bytes())
+
+
+def decode_index(data: bytes) -> PathIndex:
+    """Restore a path index stored by ``encode_index``.
+
+    Raises ``CacheFormatError`` if the entry is in any other format.
+    """
+    if not data.startswith(INDEX_MAGIC):
+        raise CacheFormatError("Unknown cache entry format")
+
+    try:
+        return PathIndex.from_bytes(
+            zstandard.ZstdDecompressor().decompress(data[len(INDEX_MAGIC) :])
+        )
+    except (zstandard.ZstdError, UnicodeDecodeError, ValueError) as e:
+        raise CacheFormatError(f"Corrupted cache entry: {e}") from e
+
+
+def decoded_size(data: bytes) -> int:
+    """Return the size of the uncompressed payload of an encoded entry."""
+    size = zstandard.frame_content_size(data[len(FORMAT_MAGIC) :])
+
+    return max(size, len(data))
+
+
+def _derive_id(parent: str, text: str) -> str:
+    return text if parent == "#" else f"{parent}/{text}"
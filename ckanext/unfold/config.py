@@ -1,9 +1,24 @@
 import ckan.plugins.toolkit as tk
 
 CONF_CACHE_ENABLE = "ckanext.unfold.enable_cache"
+CONF_CACHE_TTL = "ckanext.unfold.cache_ttl"
+CONF_REVALIDATE_AFTER = "ckanext.unfold.revalidate_after"
+CONF_ERROR_CACHE_TTL = "ckanext.unfold.error_cache_ttl"
+CONF_BUILD_LOCK_TIMEOUT = "ckanext.unfold.build_lock_timeout"
+CONF_BUILD_WAIT_TIMEOUT = "ckanext.unfold.build_wait_timeout"
+CONF_PREWARM_ENABLE = "ckanext.unfold.enable_prewarm"
+CONF_PREWARM_QUEUE = "ckanext.unfold.prewarm_queue"
+CONF_RESPONSE_CACHE_ENABLE = "ckanext.unfold.enable_response_cache"
+CONF_MEMORY_CACHE_MAX_SIZE = "ckanext.unfold.memory_cache_max_size"
 CONF_MAX_FILE_SIZE = "ckanext.unfold.max_file_size"
 CONF_EXPAND_NODES_THRESHOLD = "ckanext.unfold.expand_nodes_threshold"
+CONF_LAZY_LOAD_THRESHOLD = "ckanext.unfold.lazy_load_threshold"
 CONF_CONTEXT_MENU = "ckanext.unfold.show_context_menu_default"
+CONF_SPOOL_MAX_MEMORY_SIZE = "ckanext.unfold.spool_max_memory_size"
+CONF_HTTP_CONNECT_TIMEOUT = "ckanext.unfold.http_connect_timeout"
+CONF_HTTP_READ_TIMEOUT = "ckanext.unfold.http_read_timeout"
+CONF_HTTP_MAX_RETRIES = "ckanext.unfold.http_max_retries"
+CONF_HTTP_POOL_MAXSIZE = "ckanext.unfold.http_pool_maxsize"
 
 
 def is_cache_enabled() -> bool:
@@ -11,6 +26,51 @@ def is_cache_enabled() -> bool:
     return tk.config[CONF_CACHE_ENABLE]
 
 
+def get_cache_ttl() -> int:
+    """Get the lifetime of cached archive trees, in seconds."""
+    return tk.config[CONF_CACHE_TTL]
+
+
+def get_revalidate_after() -> int:
+    """Get the age after which a cached remote archive is revalidated, in seconds."""
+    return tk.config[CONF_REVALIDATE_AFTER]
+
+
+def get_error_cache_ttl() -> int:
+    """Get the lifetime of cached archive tree build failures, in seconds."""
+    return tk.config[CONF_ERROR_CACHE_TTL]
+
+
+def get_build_lock_timeout() -> int:
+    """Get the time after which an unfinished archive tree build is abandoned."""
+    return tk.config[CONF_BUILD_LOCK_TIMEOUT]
+
+
+def get_build_wait_timeout() -> int:
+    """Get how long a request waits for an archive tree built elsewhere."""
+    return tk.config[CONF_BUILD_WAIT_TIMEOUT]
+
+
+def is_prewarm_enabled() -> bool:
+    """Check if archive trees are built in the background on resource changes."""
+    return tk.config[CONF_PREWARM_ENABLE]
+
+
+def get_prewarm_queue() -> str:
+    """Get the name of the background job queue for building archive trees."""
+    return tk.config[CONF_PREWARM_QUEUE]
+
+
+def is_response_cache_enabled() -> bool:
+    """Check if serialized API responses are cached along with archive trees."""
+    return tk.config[CONF_RESPONSE_CACHE_ENABLE]
+
+
+def get_memory_cache_max_size() -> int:
+    """Get the size of the in-process archive tree cache, in bytes."""
+    return tk.config[CONF_MEMORY_CACHE_MAX_SIZE]
+
+
 def get_max_file_size() -> int:
     return tk.config[CONF_MAX_FILE_SIZE]
 
@@ -20,6 +80,31 @@ def get_expand_nodes_threshold() -> int:
     return tk.config[CONF_EXPAND_NODES_THRESHOLD]
 
 
+def get_lazy_load_threshold() -> int:
+    """Get the number of nodes above which directories are loaded on demand."""
+    return tk.config[CONF_LAZY_LOAD_THRESHOLD]
+
+
 def get_context_menu_default() -> bool:
     """Get the default setting for showing context menu in the UI tree view."""
     return tk.config[CONF_CONTEXT_MENU]
+
+
+def get_spool_max_memory_size() -> int:
+    """Get the size above which downloaded archives are spooled to disk."""
+    return tk.config[CONF_SPOOL_MAX_MEMORY_SIZE]
+
+
+def get_http_timeout() -> tuple[int, int]:
+    """Get the connect and read timeouts for fetching remote archives."""
+    return tk.config[CONF_HTTP_CONNECT_TIMEOUT], tk.config[CONF_HTTP_READ_TIMEOUT]
+
+
+def get_http_max_retries() -> int:
+    """Get the number of retries for failed requests to remote archives."""
+    return tk.config[CONF_HTTP_MAX_RETRIES]
+
+
+def get_http_pool_maxsize() -> int:
+    """Get the number of connections kept alive per host."""
+    return tk.config[CONF_HTTP_POOL_MAXSIZE]
@@ -1,24 +1,51 @@
-from dataclasses import asdict
 from typing import Any
 
+from simplejson import loads
+
 from ckan import types
+from ckan.lib.lazyjson import LazyJSONObject
 from ckan.logic import validate
 from ckan.plugins import toolkit as tk
 
-import ckanext.unfold.config as unf_config
 import ckanext.unfold.exception as unf_exception
 import ckanext.unfold.logic.schema as unf_schema
-import ckanext.unfold.types as unf_types
 import ckanext.unfold.utils as unf_utils
 
+MAX_SEARCH_LIMIT = 1000
+
+
+class LazyJSONResponse(LazyJSONObject):
+    """A ``LazyJSONObject`` that holds any JSON value, e.g. an empty array.
+
+    The original takes an empty result for one that isn't decoded yet, and
+    fails when it's accessed for the second time.
+    """
+
+    def _loads(self) -> Any:
+        if self._json_string is not None:
+            self._json_dict = loads(self._json_string)
+            self._json_string = None
+
+        return self._json_dict
+
 
 @tk.side_effect_free
 @validate(unf_schema.get_archive_structure)
 def get_archive_structure(
-    context: types.Context, data_dict: types.Dict[str, str]
-) -> dict[str, str] | list[dict[str, Any]]:
+    context: types.Context, data_dict: types.Dict[str, Any]
+) -> dict[str, Any] | list[Any] | LazyJSONResponse:
     """Return archive tree nodes.
 
+    :param id: the id of the resource
+    :param view_id: the id of the resource view (optional)
+    :param parent: return only the direct children of this node, ``#`` for
+        the top level (optional)
+    :param lazy: return only the top level if the archive is too large to
+        be shown at once (optional, default: ``False``)
+    :param format: ``jstree`` for a list of jstree nodes, or ``compact`` for
+        a table of rows that the client expands into nodes, several times
+        smaller for large archives (optional, default: ``jstree``)
+
     The archive URL and format are read from the resource itself (via
     ``resource_show``, which also enforces authorization) rather than from the
     request, so the caller cannot point the server at an arbitrary URL.
@@ -33,34 +60,58 @@ def get_archive_structure(
         )
 
     try:
-        nodes = unf_utils.get_archive_tree(resource, resource_view)
+        response = unf_utils.get_archive_structure_response(
+            resource,
+            resource_view,
+            parent=data_dict.get("parent"),
+            lazy=data_dict["lazy"],
+            compact=data_dict["format"] == "compact",
+        )
     except unf_exception.UnfoldError as e:
         return {"error": str(e)}
 
-    close_folders = len(nodes) > unf_config.get_expand_nodes_threshold()
-    return [_serialize_node(n, close_folders) for n in nodes]
-
-
-def _serialize_node(node: unf_types.Node, close_folders: bool) -> dict[str, Any]:
-    data = asdict(node)
-
-    size = node.data.get("size", "")
-    modified_at = node.data.get("modified_at", "")
+    # embedded into the API response as is, without decoding and re-encoding;
+    # other callers get the plain data
+    if context.get("api_version"):
+        return LazyJSONResponse(response)
 
-    if size or modified_at:
-        data["text"] += "<span class='unfold-node-metadata'>"
+    return loads(response)
 
-        if size:
-            data["text"] += f' <span class="unfold-node-size">{size}</span>'
 
-        if modified_at:
-            data["text"] += (
-                f' <span class="unfold-node-modified-at">{modified_at}</span>'
-            )
+@tk.side_effect_free
+@validate(unf_schema.search_archive_structure)
+def search_archive_structure(
+    context: types.Context, data_dict: types.Dict[str, Any]
+) -> dict[str, Any]:
+    """Search an archive tree by path.
+
+    :param id: the id of the resource
+    :param view_id: the id of the resource view (optional)
+    :param q: a part of the path to look for, or a glob pattern (with ``*``
+        and ``?``) matched against whole paths; case-insensitive, at most
+        256 characters and 16 wildcards
+    :param limit: the maximum number of matches to return (optional,
+        default: 100, at most 1000)
+
+    Returns the matching nodes with all their ancestors (``nodes``), the
+    ids of the matching nodes (``matches``) and whether some matches were
+    left out because of the limit (``truncated``).
+    """
+    resource = tk.get_action("resource_show")(context, {"id": data_dict["id"]})
 
-        data["text"] += "</span>"
+    resource_view: dict[str, Any] = {}
 
-    # close nodes by default if above threshold
-    data["state"] = {"opened": not close_folders}
+    if data_dict.get("view_id"):
+        resource_view = tk.get_action("resource_view_show")(
+            context, {"id": data_dict["view_id"]}
+        )
 
-    return data
+    try:
+        return unf_utils.search_archive_tree(
+            resource,
+            resource_view,
+            data_dict["q"],
+            min(data_dict["limit"], MAX_SEARCH_LIMIT),
+        )
+    except unf_exception.UnfoldError as e:
+        return {"error": str(e)}
@@ -23,8 +23,34 @@ def get_archive_structure(
     resource_id_exists: types.Validator,
     resource_view_id_exists: types.Validator,
     ignore_empty: types.Validator,
+    boolean_validator: types.Validator,
+    default: types.ValidatorFactory,
+    one_of: types.ValidatorFactory,
+) -> types.Schema:
+    return {
+        "id": [not_empty, unicode_safe, resource_id_exists],
+        "view_id": [ignore_empty, unicode_safe, resource_view_id_exists],
+        "parent": [ignore_empty, unicode_safe],
+        "lazy": [boolean_validator],
+        "format": [default("jstree"), one_of(["jstree", "compact"])],
+    }
+
+
+@validator_args
+def search_archive_structure(
+    not_empty: types.Validator,
+    unicode_safe: types.Validator,
+    resource_id_exists: types.Validator,
+    resource_view_id_exists: types.Validator,
+    ignore_empty: types.Validator,
+    default: types.ValidatorFactory,
+    int_validator: types.Validator,
+    is_positive_integer: types.Validator,
+    unfold_search_query: types.Validator,
 ) -> types.Schema:
     return {
         "id": [not_empty, unicode_safe, resource_id_exists],
         "view_id": [ignore_empty, unicode_safe, resource_view_id_exists],
+        "q": [not_empty, unicode_safe, unfold_search_query],
+        "limit": [default(100), int_validator, is_positive_integer],
     }
@@ -3,6 +3,8 @@ import logging
 import ckan.plugins.toolkit as tk
 from ckan import model, types
 
+import ckanext.unfold.search as unf_search
+
 log = logging.getLogger(__name__)
 
 
@@ -11,3 +13,15 @@ def resource_view_id_exists(resource_view_id: str, context: types.Context) -> st
         raise tk.Invalid("Resource view not found.")
 
     return resource_view_id
+
+
+def unfold_search_query(query: str, context: types.Context) -> str:
+    if len(query) > unf_search.MAX_QUERY_LENGTH:
+        raise tk.Invalid(
+            f"Must be at most {unf_search.MAX_QUERY_LENGTH} characters long."
+        )
+
+    if query.count("*") + query.count("?") > unf_search.MAX_WILDCARDS:
+        raise tk.Invalid(f"Must have at most {unf_search.MAX_WILDCARDS} wildcards.")
+
+    return query
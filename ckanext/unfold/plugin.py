@@ -1,7 +1,10 @@
 from __future__ import annotations
 
+import logging
 from typing import Any
 
+import redis
+
 import ckan.plugins as p
 import ckan.plugins.toolkit as tk
 from ckan import types
@@ -12,6 +15,8 @@ import ckanext.unfold.config as unf_config
 from ckanext.unfold.adapters import adapter_registry
 from ckanext.unfold.logic.schema import get_preview_schema
 
+log = logging.getLogger(__name__)
+
 
 @tk.blanket.actions
 @tk.blanket.validators
@@ -21,6 +26,7 @@ class UnfoldPlugin(p.SingletonPlugin):
     p.implements(p.IConfigurer)
     p.implements(p.IResourceView, inherit=True)
     p.implements(p.IResourceController, inherit=True)
+    p.implements(p.IPackageController, inherit=True)
 
     # IConfigurable
 
@@ -66,6 +72,72 @@ class UnfoldPlugin(p.SingletonPlugin):
 
     # IResourceController
 
+    def after_resource_create(
+        self, context: types.Context, resource: dict[str, Any]
+    ) -> None:
+        self._enqueue_prewarm(resource)
+
+    def after_resource_update(
+        self, context: types.Context, resource: dict[str, Any]
+    ) -> None:
+        self._enqueue_prewarm(resource)
+
+    # IPackageController
+
+    def after_dataset_create(
+        self, context: types.Context, pkg_dict: dict[str, Any]
+    ) -> None:
+        self._enqueue_dataset_prewarm(pkg_dict)
+
+    def after_dataset_update(
+        self, context: types.Context, pkg_dict: dict[str, Any]
+    ) -> None:
+        self._enqueue_dataset_prewarm(pkg_dict)
+
+    @classmethod
+    def _enqueue_dataset_prewarm(cls, pkg_dict: dict[str, Any]) -> None:
+        """Prewarm the resources saved along with a dataset.
+
+        Only the resources without a cached tree are enqueued, i.e. new and
+        changed ones, so editing the dataset metadata doesn't rebuild them
+        all. The hooks run before the dataset is committed, and a job that
+        starts earlier than that doesn't find its resource; resources
+        saved with the resource actions are enqueued again once committed.
+        """
+        if not (unf_config.is_cache_enabled() and unf_config.is_prewarm_enabled()):
+            return
+
+        resources: list[dict[str, Any]] = pkg_dict.get("resources") or []
+
+        for resource in resources:
+            try:
+                if unf_utils.UnfoldCacheManager.get_pointer(resource["id"]):
+                    continue
+            except redis.RedisError:
+                log.exception("Unfold: cannot enqueue archive tree build")
+                return
+
+            cls._enqueue_prewarm(resource)
+
+    @staticmethod
+    def _enqueue_prewarm(resource: dict[str, Any]) -> None:
+        """Build the archive tree in the background, so it's cached for visitors."""
+        if not (unf_config.is_cache_enabled() and unf_config.is_prewarm_enabled()):
+            return
+
+        if unf_utils.get_adapter_for_resource(resource) is None:
+            return
+
+        try:
+            tk.enqueue_job(
+                unf_utils.prewarm_archive_tree,
+                [resource["id"]],
+                title=f"Unfold: build archive tree of resource {resource['id']}",
+                queue=unf_config.get_prewarm_queue(),
+            )
+        except redis.RedisError:
+            log.exception("Unfold: cannot enqueue archive tree build")
+
     def before_resource_update(
         self, context: types.Context, current: dict[str, Any], resource: dict[str, Any]
     ) -> None:
@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import re
+import struct
+from array import array
+from bisect import bisect_right
+from collections.abc import Iterator
+
+import ckanext.unfold.types as unf_types
+
+GLOB_CHARS = re.compile(r"([*?])")
+# bounds on the queries accepted by the search action
+MAX_QUERY_LENGTH = 256
+MAX_WILDCARDS = 16
+PATHS_SIZE = struct.Struct("<Q")
+
+
+class PathIndex:
+    """A searchable index of the paths in an archive tree.
+
+    Paths are kept as a single newline-separated string, one line per node
+    in tree order, so a query is matched by one scan of that string in C
+    instead of a Python loop over the nodes. The parent of every node is
+    stored as a line number as well, to collect the ancestors of a match
+    without a lookup table of all paths.
+    """
+
+    def __init__(self, paths: str, parents: array[int]) -> None:
+        self.paths = paths
+        self.parents = parents
+        self._folded = paths.lower()
+        self._line_starts = _line_starts(paths)
+        # lowercasing may change the length of some characters
+        self._folded_line_starts = (
+            self._line_starts
+            if len(self._folded) == len(paths)
+            else _line_starts(self._folded)
+        )
+
+    @classmethod
+    def from_tree(cls, nodes: unf_types.NodeTable) -> PathIndex:
+        lines = {node_id: line for line, node_id in enumerate(nodes.ids)}
+
+        return cls(
+            "\n".join(node_id.replace("\n", " ") for node_id in nodes.ids),
+            array("q", (lines.get(parent, -1) for parent in nodes.parents)),
+        )
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> PathIndex:
+        (size,) = PATHS_SIZE.unpack_from(data)
+        start = PATHS_SIZE.size
+
+        parents = array("q")
+        parents.frombytes(data[start + size :])
+
+        return cls(data[start : start + size].decode(), parents)
+
+    def to_bytes(self) -> bytes:
+        paths = self.paths.encode()
+
+        return PATHS_SIZE.pack(len(paths)) + paths + self.parents.tobytes()
+
+    @property
+    def size(self) -> int:
+        """Estimate the memory taken by the index, in bytes."""
+        return len(self.paths) * 2 + len(self.parents) * self.parents.itemsize * 2
+
+    def search(self, query: str, limit: int) -> tuple[list[int], bool]:
+        """Find the nodes whose path matches ``query``.
+
+        A query with ``*`` or ``?`` is a case-insensitive glob matched
+        against the whole path (``*`` doesn't stop at ``/``). Any other
+        query matches paths that contain it, ignoring case.
+
+        Returns the line numbers of at most ``limit`` matching nodes, and
+        whether there are more matches.
+        """
+        lines = self._iter_matches(query)
+        matches = [line for _, line in zip(range(limit), lines)]
+
+        return matches, next(lines, None) is not None
+
+    def with_ancestors(self, lines: list[int]) -> list[int]:
+        """Add the ancestors of the given nodes, keeping the tree order."""
+        result = set(lines)
+
+        for line in lines:
+            parent = self.parents[line]
+
+            while parent >= 0 and parent not in result:
+                result.add(parent)
+                parent = self.parents[parent]
+
+        return sorted(result)
+
+    def _iter_matches(self, query: str) -> Iterator[int]:
+        if GLOB_CHARS.search(query):
+            yield from self._iter_glob_matches(query)
+        else:
+            yield from self._iter_substring_matches(query.lower())
+
+    def _iter_substring_matches(self, query: str) -> Iterator[int]:
+        if not query:
+            return
+
+        line_starts = self._folded_line_starts
+        pos = self._folded.find(query)
+
+        while pos >= 0:
+            line = bisect_right(line_starts, pos) - 1
+            yield line
+
+            if line + 1 >= len(line_starts):
+                return
+
+            pos = self._folded.find(query, line_starts[line + 1])
+
+    def _iter_glob_matches(self, query: str) -> Iterator[int]:
+        for match in re.finditer(
+            _glob_pattern(query), self.paths, re.MULTILINE | re.IGNORECASE
+        ):
+            yield bisect_right(self._line_starts, match.start()) - 1
+
+
+def _line_starts(text: str) -> array[int]:
+    return array("q", [0, *(m.end() for m in re.finditer("\n", text))])
+
+
+def _glob_pattern(query: str) -> str:
+    """Translate a glob into a regex that matches whole lines.
+
+    Nested greedy wildcards backtrack exponentially on a line that almost
+    matches. Like ``fnmatch.translate``, every piece between two ``*`` is
+    matched at its first occurrence in an atomic group, which is never
+    retried; this finds every match, as the pieces have a fixed length.
+    """
+    first, *middle = [
+        "".join(
+            "[^\n]" if part == "?" else re.escape(part)
+            for part in GLOB_CHARS.split(piece)
+        )
+        for piece in query.split("*")
+    ]
+
+    if not middle:
+        return f"^{first}$"
+
+    *middle, last = middle
+    pieces = "".join(f"(?>[^\n]*?{piece})" for piece in middle if piece)
+
+    return f"^{first}{pieces}[^\n]*{last}$"
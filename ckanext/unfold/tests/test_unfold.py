@@ -1,10 +1,29 @@
+import bz2
+import dataclasses
+import gzip
+import hashlib
+import io
+import json
 import os
 import re
+import tarfile
+import threading
+import time
+from array import array
 
 import pytest
+import redis
+import zstandard
 
-from ckanext.unfold import types, utils
-from ckanext.unfold.adapters import base
+from ckan.common import json as ckan_json
+from ckan.lib.lazyjson import LazyJSONObject
+from ckan.plugins import toolkit as tk
+
+from ckanext.unfold import cache, search, types, utils
+from ckanext.unfold.adapters import base, rpm, session
+from ckanext.unfold.exception import UnfoldError
+from ckanext.unfold.logic import action, validators
+from ckanext.unfold.plugin import UnfoldPlugin
 
 DATA_DIR = os.path.join(os.path.dirname(__file__), "data")
 BASE_URL = "http://archives.test/"
@@ -67,20 +86,47 @@ def _range_rejecting_response(data: bytes):
     return _callback
 
 
+def _counting_response(data: bytes, served: list[int]):
+    """Wrap ``_range_response`` to record the size of every served body."""
+    callback = _range_response(data)
+
+    def _callback(request, context):
+        chunk = callback(request, context)
+        served.append(len(chunk))
+        return chunk
+
+    return _callback
+
+
+@pytest.fixture(autouse=True)
+def close_cache():
+    """Don't let trees cached in-process in one test leak into the next."""
+    yield
+    utils.UnfoldCacheManager.close()
+
+
 @pytest.fixture
 def archive_url(requests_mock):
     """Serve a test data file over a mocked URL.
 
     Mirrors production, where archives are fetched by URL from the same host.
-    Returns a callable that registers a data file and yields its URL.
+    Returns a callable that registers a data file (optionally under another
+    path) and yields its URL.
     """
 
-    def register(name: str) -> str:
+    def register(name: str, path: str | None = None) -> str:
         with open(os.path.join(DATA_DIR, name), "rb") as fp:
             data = fp.read()
 
-        url = BASE_URL + name
+        url = BASE_URL + (path or name)
         requests_mock.get(url, content=_range_response(data))
+        requests_mock.head(
+            url,
+            headers={
+                "ETag": f'"{hashlib.md5(data).hexdigest()}"',
+                "Content-Length": str(len(data)),
+            },
+        )
 
         return url
 
@@ -101,7 +147,7 @@ def archive_url(requests_mock):
         ("tar.gz", 1),
         ("tar.xz", 1),
         ("tar.bz2", 1),
-        ("rpm", 355),
+        ("rpm", 361),
         ("deb", 3),
         ("ar", 1),
         ("a", 2),
@@ -137,14 +183,33 @@ def test_zip_falls_back_to_full_download_on_416(requests_mock):
 
 
 @pytest.mark.usefixtures("with_request_context")
-def test_zip_reads_local_upload_from_storage(monkeypatch):
-    """A locally uploaded archive is read via CKAN storage, not over HTTP."""
-    with open(os.path.join(DATA_DIR, "test_archive.zip"), "rb") as fp:
+@pytest.mark.parametrize("backend", ["file", "range", "stream"])
+@pytest.mark.parametrize(("file_format", "num_nodes"), [("zip", 11), ("7z", 5)])
+def test_reads_local_upload_from_storage(
+    monkeypatch, backend: str, file_format: str, num_nodes: int
+):
+    """A locally uploaded archive is read via CKAN storage, not over HTTP.
+
+    Files on the local filesystem are memory-mapped, storages with ranged
+    reads are read on demand, and anything else is streamed.
+    """
+    path = os.path.join(DATA_DIR, f"test_archive.{file_format}")
+
+    with open(path, "rb") as fp:
         data = fp.read()
 
     class FakeStorage:
-        def content(self, file_data):
-            return data
+        def supports(self, capability):
+            return backend == "range" and capability is base.files.Capability.RANGE
+
+        def range(self, file_data, start, end):
+            return [data[start:end]]
+
+        def stream(self, file_data):
+            if backend == "file":
+                return open(path, "rb")
+
+            return iter([data[:1000], data[1000:]])
 
     class FakeUploader:
         storage = FakeStorage()
@@ -158,14 +223,14 @@ def test_zip_reads_local_upload_from_storage(monkeypatch):
 
     resource = {
         "id": "res-id",
-        "format": "zip",
+        "format": file_format,
         "url_type": "upload",
         "size": str(len(data)),
     }
     adapter = utils.get_adapter_for_resource(resource)
     tree = adapter(resource, {}).build_archive_tree()  # type: ignore
 
-    assert len(tree) == 11
+    assert len(tree) == num_nodes
     assert isinstance(tree[0], types.Node)
 
 
@@ -179,3 +244,896 @@ def test_build_complex_tree(archive_url):
     assert len(tree) == 15004
     root_folders = [node for node in tree if node.parent == "#"]
     assert len(root_folders) == 4
+
+
+@pytest.mark.usefixtures("with_request_context")
+@pytest.mark.parametrize("file_format", ["tar", "tar.gz", "tar.xz", "tar.bz2"])
+def test_tar_is_streamed_not_buffered(archive_url, monkeypatch, file_format: str):
+    """Tar listings read the body as a stream instead of buffering it whole."""
+    url = archive_url(f"test_archive.{file_format}")
+
+    def _fail(*args, **kwargs):
+        raise AssertionError("archive must not be buffered")
+
+    monkeypatch.setattr(base.BaseAdapter, "get_file_content", _fail)
+
+    adapter = utils.get_adapter_for_resource({"format": file_format})
+    tree = adapter({}, {}, filepath=url).build_archive_tree()  # type: ignore
+
+    assert tree
+    assert all(isinstance(node, types.Node) for node in tree)
+
+
+@pytest.mark.usefixtures("with_request_context")
+def test_tar_hops_between_headers_with_ranges(requests_mock):
+    """A plain tar is listed by fetching headers only, skipping member data."""
+    buffer = io.BytesIO()
+
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        for name in ("big/one.bin", "big/two.bin", "small.txt"):
+            size = 1024 if name == "small.txt" else 4 * 1024 * 1024
+            info = tarfile.TarInfo(name)
+            info.size = size
+            archive.addfile(info, io.BytesIO(b"\0" * size))
+
+    data = buffer.getvalue()
+    served: list[int] = []
+
+    url = BASE_URL + "large.tar"
+    requests_mock.get(url, content=_counting_response(data, served))
+
+    adapter = utils.get_adapter_for_resource({"format": "tar"})
+    tree = adapter({}, {}, filepath=url).build_archive_tree()  # type: ignore
+
+    assert {node.id for node in tree} >= {"big/one.bin", "big/two.bin", "small.txt"}
+    assert sum(served) < len(data) // 10
+
+
+def test_implicit_directories_are_inferred(requests_mock):
+    """Parents missing from a listing get nodes, repeated members are merged."""
+    buffer = io.BytesIO()
+
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        for name, content in (
+            ("./data/2024/a.csv", b"a"),
+            ("data/2024/b.csv", b"bb"),
+            ("data//2024/a.csv", b"newer"),
+        ):
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+
+    url = BASE_URL + "implicit.tar"
+    requests_mock.get(url, content=_range_response(buffer.getvalue()))
+
+    adapter = utils.get_adapter_for_resource({"format": "tar"})
+    tree = adapter({}, {}, filepath=url).build_archive_tree()  # type: ignore
+    nodes = {node.id: node for node in tree}
+
+    assert list(nodes) == ["data", "data/2024", "data/2024/a.csv", "data/2024/b.csv"]
+    assert [node.parent for node in nodes.values()] == [
+        "#",
+        "data",
+        "data/2024",
+        "data/2024",
+    ]
+    assert nodes["data/2024"].icon == "fa fa-folder"
+    assert nodes["data/2024"].children
+    assert nodes["data/2024/a.csv"].data["size"] == len(b"newer")
+
+
+def test_tar_zst_is_streamed(requests_mock):
+    """A tar.zst archive is listed through a streaming decompressor."""
+    buffer = io.BytesIO()
+
+    with tarfile.open(fileobj=buffer, mode="w") as archive:
+        for name, content in (("data/a.csv", b"a" * 1000), ("b.txt", b"b")):
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+
+    url = BASE_URL + "archive.tar.zst"
+    requests_mock.get(
+        url, content=zstandard.ZstdCompressor().compress(buffer.getvalue())
+    )
+
+    adapter = utils.get_adapter_for_resource({"format": "tar.zst"})
+    tree = adapter({}, {}, filepath=url).build_archive_tree()  # type: ignore
+    nodes = {node.id: node for node in tree}
+
+    assert list(nodes) == ["data", "data/a.csv", "b.txt"]
+    assert nodes["data/a.csv"].data["size"] == 1000
+
+
+@pytest.mark.parametrize(
+    ("fmt", "compress", "expected_size"),
+    [
+        ("gz", lambda data: gzip.compress(data, mtime=1700000000), 5000),
+        ("zst", zstandard.ZstdCompressor().compress, 5000),
+        ("bz2", bz2.compress, None),
+    ],
+)
+def test_compressed_file_is_described(requests_mock, fmt, compress, expected_size):
+    """A single compressed file is shown as the file it decompresses to."""
+    data = compress(b"x" * 5000)
+    url = BASE_URL + f"download/table.csv.{fmt}"
+    requests_mock.get(url, content=_range_response(data))
+
+    adapter = utils.get_adapter_for_resource({"format": fmt})
+    resource = {"id": "res-17", "url": BASE_URL + "dataset/res-17"}
+    tree = adapter(resource, {}, filepath=url).build_archive_tree()  # type: ignore
+
+    assert [node.id for node in tree] == ["table.csv"]
+    assert tree.icons[0] == "fa fa-file-csv"
+    assert tree.sizes[0] == expected_size
+    assert tree.compressed_sizes[0] == len(data)
+
+    if fmt == "gz":
+        assert tree.modified_at[0] == 1700000000
+
+
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_directories_are_summed_up(archive_url):
+    """Folders carry the sizes, file count and newest date of their subtree."""
+    resource = {"id": "res-16", "url": archive_url("test_archive.zip"), "format": "zip"}
+    tree = utils.get_archive_tree(resource, {})
+    nodes = {node.id: node for node in tree}
+    files = [node for node in tree if node.icon != "fa fa-folder"]
+    below = [node for node in files if node.id.startswith("test_archive/folder 1/")]
+
+    assert nodes["test_archive"].data["file_count"] == len(files) == 7
+    assert nodes["test_archive"].data["size"] == sum(n.data["size"] for n in files)
+    assert nodes["test_archive"].data["compressed_size"] == sum(
+        n.data["compressed_size"] for n in files
+    )
+    assert nodes["test_archive/folder 1"].data["file_count"] == len(below)
+    assert nodes["test_archive/folder 1"].data["modified_at"] >= max(
+        n.data["modified_at"] for n in below
+    )
+    assert "file_count" not in files[0].data
+
+    serialized = json.loads(
+        utils.get_archive_structure_response(resource, {}, parent="#")
+    )
+
+    assert serialized[0]["data"]["file_count"] == 7
+    assert serialized[0]["data"]["size"] == utils.printable_file_size(
+        nodes["test_archive"].data["size"]
+    )
+
+
+@pytest.mark.usefixtures("with_request_context")
+def test_7z_fetches_only_headers_with_ranges(requests_mock):
+    """A 7z file list is read from the signature and next headers only."""
+    with open(os.path.join(DATA_DIR, "test_archive.7z"), "rb") as fp:
+        data = fp.read()
+
+    served: list[int] = []
+    url = BASE_URL + "test_archive.7z"
+    requests_mock.get(url, content=_counting_response(data, served))
+
+    adapter = utils.get_adapter_for_resource({"format": "7z"})
+    tree = adapter({}, {}, filepath=url).build_archive_tree()  # type: ignore
+
+    assert len(tree) == 5
+    assert len(served) == 2
+    assert sum(served) < len(data) // 4
+
+
+@pytest.mark.usefixtures("with_request_context")
+def test_rpm_is_listed_from_header(requests_mock):
+    """An RPM file list comes from its header, without reading the payload."""
+    with open(os.path.join(DATA_DIR, "test_archive.rpm"), "rb") as fp:
+        data = fp.read()
+
+    served: list[int] = []
+    url = BASE_URL + "test_archive.rpm"
+    requests_mock.get(url, content=_counting_response(data, served))
+
+    adapter = utils.get_adapter_for_resource({"format": "rpm"})
+    tree = adapter({}, {}, filepath=url).build_archive_tree()  # type: ignore
+
+    files = [node for node in tree if node.icon != "fa fa-folder"]
+    ids = {node.id for node in tree} | {"#"}
+
+    assert sum(served) < len(data) // 2
+    assert files and all(node.data["modified_at"] for node in files)
+    assert all(node.parent in ids for node in tree)
+
+    # a server without ranges is only read up to the end of the header
+    read: list[int] = []
+
+    class Body(io.BytesIO):
+        def close(self):
+            read.append(self.tell())
+            super().close()
+
+    requests_mock.get(url, body=lambda request, context: Body(data))
+
+    assert adapter({}, {}, filepath=url).build_archive_tree() == tree  # type: ignore
+    assert sum(read) < len(data) // 2
+
+
+def test_rpm_without_mtimes(monkeypatch):
+    """Files without a modification time get none, rather than the epoch."""
+    headers = {"oldfilenames": [b"/usr/bin/tool"], "filesizes": [10]}
+    monkeypatch.setattr(rpm.rpm_headers, "get_headers", lambda fileobj: (None, headers))
+
+    (entry,) = rpm.RpmAdapter._read_file_list(io.BytesIO())
+
+    assert (entry.name, entry.size, entry.mtime) == ("usr/bin/tool", 10, None)
+
+
+@pytest.mark.usefixtures("with_request_context")
+def test_ar_hops_between_headers_with_ranges(requests_mock):
+    """An ar archive is listed by fetching member headers only."""
+    members = [(b"small.txt", 100), (b"big.bin", 4 * 1024 * 1024), (b"end.o", 10)]
+    data = b"!<arch>\n"
+
+    for name, size in members:
+        header = b"%-16s%-12d%-6d%-6d%-8s%-10d`\n" % (name, 0, 0, 0, b"100644", size)
+        data += header + b"\0" * (size + size % 2)
+
+    served: list[int] = []
+    url = BASE_URL + "large.a"
+    requests_mock.get(url, content=_counting_response(data, served))
+
+    adapter = utils.get_adapter_for_resource({"format": "a"})
+    tree = adapter({}, {}, filepath=url).build_archive_tree()  # type: ignore
+
+    assert [node.id for node in tree] == ["small.txt", "big.bin", "end.o"]
+    assert sum(served) < len(data) // 10
+
+
+@pytest.mark.usefixtures("with_request_context")
+@pytest.mark.ckan_config("ckanext.unfold.spool_max_memory_size", 1024)
+@pytest.mark.parametrize(
+    ("file_format", "num_nodes"), [("rar", 13), ("7z", 5), ("rpm", 361), ("deb", 3)]
+)
+def test_full_download_is_spooled(requests_mock, file_format: str, num_nodes: int):
+    """Full downloads above the spool threshold are read from a temp file."""
+    with open(os.path.join(DATA_DIR, f"test_archive.{file_format}"), "rb") as fp:
+        data = fp.read()
+
+    url = BASE_URL + f"test_archive.{file_format}"
+    requests_mock.get(url, content=_range_rejecting_response(data))
+
+    adapter = utils.get_adapter_for_resource({"format": file_format})
+    tree = adapter({}, {}, filepath=url).build_archive_tree()  # type: ignore
+
+    assert len(tree) == num_nodes
+
+
+@pytest.mark.usefixtures("with_request_context")
+def test_zip_fetches_exact_central_directory(requests_mock):
+    """A central directory larger than the tail is fetched with one request."""
+    with open(os.path.join(DATA_DIR, "test_complex_nested.zip"), "rb") as fp:
+        data = fp.read()
+
+    served: list[int] = []
+    url = BASE_URL + "test_complex_nested.zip"
+    requests_mock.get(url, content=_counting_response(data, served))
+
+    adapter = utils.get_adapter_for_resource({"format": "zip"})
+    tree = adapter({}, {}, filepath=url).build_archive_tree()  # type: ignore
+
+    eocd = data.rfind(b"PK\x05\x06")
+    cd_size = int.from_bytes(data[eocd + 12 : eocd + 16], "little")
+
+    assert len(tree) == 15004
+    assert len(served) == 2
+    assert sum(served) == len(data) - eocd + cd_size
+
+
+def test_sessions_share_connection_pool():
+    """Each thread has its own session, all backed by one pooled adapter."""
+    sessions = [session.get_session()]
+    thread = threading.Thread(target=lambda: sessions.append(session.get_session()))
+    thread.start()
+    thread.join()
+
+    main, other = sessions
+
+    assert main is session.get_session()
+    assert main is not other
+    assert main.get_adapter("https://a.test") is other.get_adapter("http://b.test")
+
+
+@pytest.mark.usefixtures("clean_redis")
+def test_tree_cache_is_served_from_memory():
+    """Hot trees skip Redis, and deletions reach every worker's memory cache."""
+    nodes = types.NodeTable.from_nodes(
+        [types.Node(id="a.txt", text="a.txt", icon="fa fa-file", parent="#")]
+    )
+    cache_key = utils.UnfoldCacheManager.resource_cache_key("res-1")
+    utils.UnfoldCacheManager.save(nodes, cache_key)
+
+    # gone from Redis, but still served from the in-process cache
+    conn = utils.UnfoldCacheManager._ensure_conn()
+    conn.delete(utils.UnfoldCacheManager._key(cache_key))
+    assert utils.UnfoldCacheManager.get(cache_key) == nodes
+
+    # an invalidation published by another worker evicts it
+    conn.publish(utils.UnfoldCacheManager._CHANNEL, "res-1")
+
+    for _ in range(50):
+        if not utils.UnfoldCacheManager.get(cache_key):
+            break
+        threading.Event().wait(0.1)
+
+    assert not utils.UnfoldCacheManager.get(cache_key)
+
+
+@pytest.mark.usefixtures("clean_redis")
+def test_saved_pointer_replaces_the_in_process_copy(monkeypatch):
+    """A worker sees its own pointer update before the notification arrives."""
+    monkeypatch.setattr(utils.UnfoldCacheManager, "_on_invalidate", lambda msg: None)
+
+    utils.UnfoldCacheManager.save_pointer("res-1", types.CachePointer("old"))
+    assert utils.UnfoldCacheManager.get_pointer("res-1").key == "old"  # type: ignore
+
+    utils.UnfoldCacheManager.save_pointer("res-1", types.CachePointer("new"))
+    assert utils.UnfoldCacheManager.get_pointer("res-1").key == "new"  # type: ignore
+
+
+def test_cache_encoding_round_trip(archive_url):
+    """The compact cache format restores the tree exactly, at a fraction of JSON."""
+    adapter = utils.get_adapter_for_resource({"format": "zip"})
+    adapter_instance = adapter({}, {}, filepath=archive_url("test_archive.zip"))  # type: ignore
+    nodes = adapter_instance.build_archive_tree()
+    nodes.append(
+        types.Node(
+            id="custom",
+            text="label",
+            icon="fa fa-star",
+            parent="#",
+            state={"opened": False},
+            a_attr=None,
+            children=True,
+            data={"size": 42, "owner": "me"},
+        )
+    )
+
+    encoded = cache.encode_nodes(nodes)
+
+    assert cache.decode_nodes(encoded) == nodes
+    assert list(cache.decode_nodes(encoded)) == list(nodes)
+    assert len(encoded) * 5 < len(json.dumps([dataclasses.asdict(n) for n in nodes]))
+
+
+@pytest.mark.usefixtures("clean_redis")
+def test_outdated_cache_entry_is_dropped():
+    """Entries left in the old JSON format are treated as a miss and removed."""
+    conn = utils.UnfoldCacheManager._ensure_conn()
+    key = utils.UnfoldCacheManager._key("res-2")
+    conn.set(key, json.dumps([{"id": "a", "text": "a", "icon": "", "parent": "#"}]))
+
+    assert not utils.UnfoldCacheManager.get("res-2")
+    assert not conn.exists(key)
+
+
+@pytest.mark.usefixtures("clean_redis")
+def test_response_is_built_outside_of_requests(archive_url):
+    """Background jobs and the CLI can build responses without a request."""
+    resource = {"id": "res-20", "url": archive_url("test_archive.zip"), "format": "zip"}
+
+    assert len(json.loads(utils.get_archive_structure_response(resource, {}))) == 11
+
+
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_api_response_is_cached(archive_url, monkeypatch):
+    """A warm hit returns the serialized response without touching the tree."""
+    resource = {"id": "res-3", "url": archive_url("test_archive.zip"), "format": "zip"}
+    response = utils.get_archive_structure_response(resource, {})
+
+    def fail(*args):
+        raise AssertionError("tree was rebuilt")
+
+    monkeypatch.setattr(utils, "get_archive_tree", fail)
+    utils.UnfoldCacheManager._memory.clear()
+
+    assert utils.get_archive_structure_response(resource, {}) == response
+    assert len(json.loads(response)) == 11
+
+    # embedded into the API envelope verbatim
+    envelope = ckan_json.dumps({"result": LazyJSONObject(response)})
+    assert envelope == '{"result": ' + response + "}"
+
+
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_only_directory_responses_are_cached(archive_url):
+    """Arbitrary ``parent`` values can't grow the cached responses of a tree."""
+    resource = {"id": "res-19", "url": archive_url("test_archive.zip"), "format": "zip"}
+    pointer = utils.get_cache_pointer(resource, {})
+    conn = utils.UnfoldCacheManager._ensure_conn()
+    key = utils.UnfoldCacheManager._response_key(pointer.key)
+
+    children = json.loads(
+        utils.get_archive_structure_response(resource, {}, parent="test_archive")
+    )
+
+    for parent in ("nope", "test_archive/folder 1/test.txt"):
+        assert utils.get_archive_structure_response(resource, {}, parent=parent) == "[]"
+
+    assert [node["id"] for node in children] == [
+        "test_archive/folder 1",
+        "test_archive/folder 2",
+    ]
+    assert [field.decode() for field in conn.hkeys(key)] == [
+        f"parent=test_archive;timezone={tk.config.get('ckan.display_timezone')}"
+    ]
+
+
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_action_returns_arrays(archive_url, monkeypatch):
+    """API calls get a lazy response, and others the decoded data."""
+    resource = {"id": "res-3a", "url": archive_url("test_archive.zip"), "format": "zip"}
+    data_dict = {"id": "res-3a", "parent": "test_archive/folder 1/test.txt"}
+    monkeypatch.setattr(tk, "get_action", lambda name: lambda ctx, data: resource)
+    get_archive_structure = action.get_archive_structure.__wrapped__  # type: ignore
+
+    data_dict.update(lazy=False, format="jstree")
+
+    leaf = get_archive_structure({"api_version": 3}, data_dict)
+
+    assert isinstance(leaf, action.LazyJSONResponse)
+    assert len(leaf) == 0
+    assert len(leaf) == 0
+    assert ckan_json.dumps({"result": leaf}) == '{"result": []}'
+
+    tree = get_archive_structure({}, {**data_dict, "parent": None})
+
+    assert isinstance(tree, list)
+    assert tree[0]["id"] == "test_archive"
+
+
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_same_archive_is_cached_once(archive_url, requests_mock):
+    """Resources linking the same archive share a single cache entry."""
+    url = archive_url("test_archive.zip")
+
+    first = {"id": "res-4", "url": url, "format": "zip"}
+    second = {"id": "res-5", "url": url, "format": "zip"}
+
+    utils.get_archive_tree(first, {})
+    downloads = [r for r in requests_mock.request_history if r.method == "GET"]
+
+    assert utils.get_archive_tree(second, {})
+    assert [r for r in requests_mock.request_history if r.method == "GET"] == downloads
+    assert utils.get_cache_key(first, {}) == utils.get_cache_key(second, {})
+
+    # the same validators on another host don't make it the same archive
+    mirror = archive_url("test_archive.zip", path="mirror/test_archive.zip")
+    third = {"id": "res-5a", "url": mirror, "format": "zip"}
+
+    assert utils.get_cache_key(third, {}) != utils.get_cache_key(first, {})
+
+    # a resource whose archive changed gets a new key
+    utils.UnfoldCacheManager.delete("res-5")
+    requests_mock.head(url, headers={"ETag": '"other"', "Content-Length": "1"})
+
+    assert utils.get_cache_key(second, {}) != utils.get_cache_key(first, {})
+
+
+def test_upload_fingerprint_ignores_hash():
+    """The free-text ``hash`` field can't make uploads share a cache entry."""
+    upload = {
+        "url_type": "upload",
+        "url": "test_archive.zip",
+        "hash": "abc",
+        "size": 100,
+        "last_modified": "2024-01-01T00:00:00",
+    }
+    first = base.BaseAdapter({**upload, "id": "res-a"}, {})
+    second = base.BaseAdapter({**upload, "id": "res-b"}, {})
+
+    unsized = base.BaseAdapter({**upload, "id": "res-c", "size": None}, {})
+
+    assert first.get_fingerprint() != second.get_fingerprint()
+    assert unsized.get_fingerprint() is None
+
+
+@pytest.mark.ckan_config("ckanext.unfold.revalidate_after", 0)
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_remote_archive_is_revalidated(archive_url, requests_mock):
+    """A stale entry costs a 304 while unchanged and is rebuilt once changed."""
+    url = archive_url("test_archive.zip")
+    etag = '"v1"'
+
+    def head(request, context):
+        context.headers["ETag"] = etag
+        context.headers["Content-Length"] = "100"
+        not_modified = request.headers.get("If-None-Match") == etag
+        context.status_code = 304 if not_modified else 200
+
+    requests_mock.head(url, content=head)
+    resource = {"id": "res-6", "url": url, "format": "zip"}
+
+    key = utils.get_cache_key(resource, {})
+    utils.get_archive_tree(resource, {})
+    downloads = len(requests_mock.request_history)
+
+    utils.get_archive_tree(resource, {})
+    last = requests_mock.request_history[-1]
+
+    assert len(requests_mock.request_history) == downloads + 1
+    assert (last.method, last.headers["If-None-Match"]) == ("HEAD", etag)
+    assert utils.get_cache_key(resource, {}) == key
+
+    etag = '"v2"'
+
+    assert utils.get_cache_key(resource, {}) != key
+
+
+@pytest.mark.ckan_config("ckanext.unfold.revalidate_after", 0)
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_failed_revalidation_keeps_the_tree(archive_url, requests_mock):
+    """A server error says nothing about the archive, so its tree is kept."""
+    url = archive_url("test_archive.zip")
+    resource = {"id": "res-6a", "url": url, "format": "zip"}
+
+    key = utils.get_cache_key(resource, {})
+    utils.get_archive_tree(resource, {})
+    pointer = utils.UnfoldCacheManager.get_pointer("res-6a")
+
+    requests_mock.head(url, status_code=503)
+    requests_mock.reset_mock()
+
+    assert utils.get_cache_key(resource, {}) == key
+    assert utils.get_archive_tree(resource, {})
+    assert not any(r.method == "GET" for r in requests_mock.request_history)
+
+    retried = utils.UnfoldCacheManager.get_pointer("res-6a")
+
+    assert retried.fingerprint == pointer.fingerprint  # type: ignore
+    assert retried.checked_at == pointer.checked_at  # type: ignore
+    assert retried.retried_at  # type: ignore
+
+    # once the server is back, the check goes on as usual
+    requests_mock.head(url, status_code=304)
+
+    assert utils.get_cache_key(resource, {}) == key
+
+    checked = utils.UnfoldCacheManager.get_pointer("res-6a")
+
+    assert checked.checked_at > pointer.checked_at  # type: ignore
+
+
+@pytest.mark.ckan_config("ckanext.unfold.enable_prewarm", True)
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_tree_is_prewarmed_in_background(archive_url, monkeypatch):
+    """Saving a resource enqueues a job that fills the cache."""
+    resource = {"id": "res-7", "url": archive_url("test_archive.zip"), "format": "zip"}
+    jobs = []
+
+    monkeypatch.setattr(tk, "enqueue_job", lambda *args, **kwargs: jobs.append(args))
+    monkeypatch.setattr(tk, "get_action", lambda name: lambda ctx, data: resource)
+
+    plugin = UnfoldPlugin()
+    plugin.after_resource_create({}, resource)
+    plugin.after_resource_update({}, {"id": "res-8", "format": "csv"})
+
+    assert jobs == [(utils.prewarm_archive_tree, ["res-7"])]
+
+    fn, args = jobs[0]
+    fn(*args)
+
+    assert utils.UnfoldCacheManager.get(utils.get_cache_key(resource, {}))
+
+
+@pytest.mark.ckan_config("ckanext.unfold.enable_prewarm", True)
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_dataset_resources_are_prewarmed(archive_url, monkeypatch):
+    """Saving a dataset enqueues a job for each archive without a cached tree."""
+    cached = {"id": "res-7a", "url": archive_url("test_archive.zip"), "format": "zip"}
+    new = {"id": "res-7b", "url": archive_url("test_archive.zip"), "format": "zip"}
+    jobs = []
+
+    utils.get_cache_pointer(cached, {})
+    monkeypatch.setattr(tk, "enqueue_job", lambda *args, **kwargs: jobs.append(args))
+
+    plugin = UnfoldPlugin()
+    plugin.after_dataset_create({}, {"resources": [new]})
+    plugin.after_dataset_update(
+        {}, {"resources": [cached, new, {"id": "res-7c", "format": "csv"}]}
+    )
+
+    assert jobs == [(utils.prewarm_archive_tree, ["res-7b"])] * 2
+
+
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_concurrent_requests_wait_for_single_build(archive_url, requests_mock):
+    """While another worker builds a tree, requests wait instead of downloading."""
+    resource = {"id": "res-9", "url": archive_url("test_archive.zip"), "format": "zip"}
+    pointer = utils.get_cache_pointer(resource, {})
+    nodes = types.NodeTable.from_nodes(
+        [types.Node(id="a.txt", text="a.txt", icon="fa fa-file", parent="#")]
+    )
+
+    lock = utils.UnfoldCacheManager.build_lock(pointer.key)
+    assert lock.acquire(blocking=False)
+
+    def finish_build():
+        utils.UnfoldCacheManager.save(nodes, pointer.key)
+        lock.release()
+
+    threading.Timer(0.5, finish_build).start()
+    requests_mock.reset_mock()
+
+    assert utils.get_archive_tree(resource, {}) == nodes
+    assert not requests_mock.request_history
+
+
+@pytest.mark.ckan_config("ckanext.unfold.enable_prewarm", False)
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_stale_tree_is_served_while_rebuilding(archive_url):
+    """Once an archive changed, its old tree is served until the new one is built."""
+    resource = {"id": "res-10", "url": archive_url("test_archive.zip"), "format": "zip"}
+    pointer = utils.get_cache_pointer(resource, {})
+    stale = types.NodeTable.from_nodes(
+        [types.Node(id="old.txt", text="old.txt", icon="fa fa-file", parent="#")]
+    )
+
+    utils.UnfoldCacheManager.save(stale, "previous")
+    utils.UnfoldCacheManager.save_pointer(
+        "res-10", dataclasses.replace(pointer, previous_key="previous")
+    )
+
+    lock = utils.UnfoldCacheManager.build_lock(pointer.key)
+    assert lock.acquire(blocking=False)
+
+    assert utils.get_archive_tree(resource, {}) == stale
+
+    lock.release()
+
+    assert len(utils.get_archive_tree(resource, {})) == 11
+
+
+@pytest.mark.ckan_config("ckanext.unfold.enable_prewarm", True)
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_tree_is_built_inline_without_job_queue(archive_url, monkeypatch):
+    """Without a job queue, the new tree is built instead of serving the old one."""
+    resource = {"id": "res-18", "url": archive_url("test_archive.zip"), "format": "zip"}
+    pointer = utils.get_cache_pointer(resource, {})
+    stale = types.NodeTable.from_nodes(
+        [types.Node(id="old.txt", text="old.txt", icon="fa fa-file", parent="#")]
+    )
+
+    utils.UnfoldCacheManager.save(stale, "previous")
+    utils.UnfoldCacheManager.save_pointer(
+        "res-18", dataclasses.replace(pointer, previous_key="previous")
+    )
+
+    def enqueue_job(*args, **kwargs):
+        raise redis.ConnectionError("no queue")
+
+    monkeypatch.setattr(tk, "enqueue_job", enqueue_job)
+
+    assert len(utils.get_archive_tree(resource, {})) == 11
+
+
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_failed_build_is_cached(requests_mock):
+    """A broken archive is not downloaded again until its resource changes."""
+    url = BASE_URL + "broken.zip"
+    requests_mock.head(url, headers={"ETag": '"1"', "Content-Length": "4"})
+    requests_mock.get(url, content=b"oops")
+    resource = {"id": "res-11", "url": url, "format": "zip"}
+
+    with pytest.raises(UnfoldError) as first:
+        utils.get_archive_tree(resource, {})
+
+    requests_mock.reset_mock()
+
+    with pytest.raises(UnfoldError) as second:
+        utils.get_archive_tree(resource, {})
+
+    assert str(second.value) == str(first.value)
+    assert not requests_mock.request_history
+
+    utils.UnfoldCacheManager.delete("res-11")
+
+    with pytest.raises(UnfoldError):
+        utils.get_archive_tree(resource, {})
+
+    assert any(r.method == "GET" for r in requests_mock.request_history)
+
+
+@pytest.mark.ckan_config("ckanext.unfold.lazy_load_threshold", 5)
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_directories_are_loaded_on_demand(archive_url):
+    """Huge trees are sent one directory at a time, with expandable folders."""
+    resource = {"id": "res-12", "url": archive_url("test_archive.zip"), "format": "zip"}
+    tree = utils.get_archive_tree(resource, {})
+    folders = {node.parent for node in tree} - {"#"}
+
+    assert {node.id for node in tree if node.children} == folders
+
+    full = json.loads(utils.get_archive_structure_response(resource, {}))
+    top = json.loads(utils.get_archive_structure_response(resource, {}, lazy=True))
+
+    assert len(full) == len(tree)
+    assert not any(node["children"] for node in full)
+    assert {node["id"] for node in top} == {n.id for n in tree if n.parent == "#"}
+
+    folder = next(node for node in top if node["children"])
+    children = json.loads(
+        utils.get_archive_structure_response(resource, {}, parent=folder["id"])
+    )
+
+    assert children
+    assert {node["parent"] for node in children} == {folder["id"]}
+
+
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_archive_paths_are_searched_on_server(archive_url, requests_mock):
+    """Matches come with their ancestors, and the path index is cached."""
+    resource = {"id": "res-13", "url": archive_url("test_archive.zip"), "format": "zip"}
+
+    result = utils.search_archive_tree(resource, {}, "TEST.TXT", 10)
+    ids = [node["id"] for node in result["nodes"]]
+
+    assert sorted(result["matches"]) == [
+        "test_archive/folder 1/test.txt",
+        "test_archive/folder 2/test.txt",
+    ]
+    assert not result["truncated"]
+    assert ids[0] == "test_archive"
+    assert set(ids) == {
+        "test_archive",
+        "test_archive/folder 1",
+        "test_archive/folder 2",
+        *result["matches"],
+    }
+
+    requests_mock.reset_mock()
+    pointer = utils.get_cache_pointer(resource, {})
+
+    assert utils.UnfoldCacheManager.get_index(pointer.key) is not None
+
+    result = utils.search_archive_tree(resource, {}, "*/folder ?/*.xlsx", 1)
+
+    assert len(result["matches"]) == 1
+    assert result["matches"][0].endswith("test.xlsx")
+    assert result["truncated"]
+    assert not any(r.method == "GET" for r in requests_mock.request_history)
+
+
+def test_glob_search_does_not_backtrack():
+    """Near misses of a glob with many wildcards are rejected in linear time."""
+    paths = [f"dir{i}/{'a' * 60}b.txt" for i in range(200)]
+    index = search.PathIndex("\n".join(paths), array("q", [-1] * len(paths)))
+
+    start = time.monotonic()
+    assert index.search("*a*a*a*a*a*z", 10) == ([], False)
+    assert time.monotonic() - start < 1
+
+    assert index.search("DIR1?/*a*b.txt", 2) == ([10, 11], True)
+    assert index.search("dir0/a*a", 10) == ([], False)
+
+    with pytest.raises(tk.Invalid):
+        validators.unfold_search_query("*a" * 20, {})  # type: ignore
+
+    with pytest.raises(tk.Invalid):
+        validators.unfold_search_query("a" * 1000, {})  # type: ignore
+
+
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_compact_response_format(archive_url):
+    """Compact rows expand into the same nodes as the default format."""
+    resource = {"id": "res-14", "url": archive_url("test_archive.zip"), "format": "zip"}
+
+    nodes = json.loads(utils.get_archive_structure_response(resource, {}))
+    compact = json.loads(
+        utils.get_archive_structure_response(resource, {}, compact=True)
+    )
+
+    assert compact["format"] == "compact"
+    assert len(compact["rows"]) == len(nodes)
+
+    column = {name: index for index, name in enumerate(compact["columns"])}
+    formatter = utils.MetadataFormatter()
+    expanded = []
+
+    for index, row in enumerate(compact["rows"]):
+        parent = compact["parents"][row[column["parent"]]]
+        text = row[column["text"]]
+        node_id = compact["ids"].get(str(index)) or (
+            text if parent == "#" else f"{parent}/{text}"
+        )
+        expanded.append(
+            {
+                "id": node_id,
+                "parent": parent,
+                "icon": compact["icons"][row[column["icon"]]],
+                "size": formatter.size(row[column["size"]]),
+                "modified_at": (
+                    compact["dates"][row[column["modified_at"]]]
+                    if row[column["modified_at"]] is not None
+                    else ""
+                ),
+                "opened": compact["opened"],
+            }
+        )
+
+    assert expanded == [
+        {
+            "id": node["id"],
+            "parent": node["parent"],
+            "icon": node["icon"],
+            "size": node["data"]["size"],
+            "modified_at": node["data"]["modified_at"],
+            "opened": node["state"]["opened"],
+        }
+        for node in nodes
+    ]
+    assert len(json.dumps(compact)) < len(json.dumps(nodes)) / 2
+
+    # fields of a custom adapter's nodes are applied on top of the row
+    tree = types.NodeTable.from_nodes(
+        [
+            types.Node(
+                id="a.txt",
+                text="a.txt",
+                icon="fa fa-file",
+                parent="#",
+                state={"opened": True},
+                li_attr={"class": "custom"},
+                a_attr={"href": "http://example.com/a.txt", "target": "_blank"},
+                data={"size": 1, "owner": "me"},
+            ),
+            types.Node(id="b.txt", text="b.txt", icon="fa fa-file", parent="#"),
+        ]
+    )
+    nodes = json.loads(utils._serialize_tree(tree))
+    compact = json.loads(utils._serialize_tree(tree, compact=True))
+
+    for index, node in enumerate(nodes):
+        fields = {
+            "li_attr": None,
+            "a_attr": compact["a_attr"],
+            **compact["extra"].get(str(index), {}),
+        }
+
+        assert fields.pop("data", {}).items() <= node["data"].items()
+        assert fields == {"li_attr": node["li_attr"], "a_attr": node["a_attr"]}
+
+    assert compact["extra"]["0"]["a_attr"]["href"] == "http://example.com/a.txt"
+    assert compact["extra"]["0"]["data"] == {"owner": "me"}
+    assert "1" not in compact["extra"]
+
+
+@pytest.mark.ckan_config("ckan.display_timezone", "Australia/Sydney")
+def test_dates_are_shown_in_display_timezone():
+    """Dates are converted from UTC to the configured display timezone."""
+    formatter = utils.MetadataFormatter()
+
+    # 12:00 UTC is 23:00 in Sydney in January (AEDT, UTC+11)
+    assert formatter.modified_at(1704110400) == "01/01/2024 - 23:00"
+    assert formatter.modified_at(0) == formatter.modified_at(None) == ""
+
+
+@pytest.mark.usefixtures("with_request_context", "clean_redis")
+def test_metadata_is_formatted_once_per_value(archive_url, monkeypatch):
+    """Trees keep raw sizes and dates, formatted when a response is built."""
+    resource = {"id": "res-15", "url": archive_url("test_archive.zip"), "format": "zip"}
+    tree = utils.get_archive_tree(resource, {})
+
+    assert all(isinstance(size, int) for size in tree.sizes)
+    assert all(isinstance(mtime, int) for mtime in tree.modified_at)
+
+    calls = []
+    render_datetime = tk.h.render_datetime
+
+    def counting_render_datetime(*args, **kwargs):
+        calls.append(args)
+        return render_datetime(*args, **kwargs)
+
+    monkeypatch.setattr(tk.h, "render_datetime", counting_render_datetime)
+    nodes = json.loads(utils.get_archive_structure_response(resource, {}))
+
+    assert len(calls) == len(set(tree.modified_at))
+    assert all(node["data"]["modified_at"] for node in nodes)
+    assert {node["data"]["size"] for node in nodes if node["data"]["size"]} <= {
+        utils.printable_file_size(size) for size in tree.sizes
+    }
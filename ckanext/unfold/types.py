@@ -1,14 +1,14 @@
 from __future__ import annotations
 
-from collections.abc import Hashable
+from collections.abc import Hashable, Iterable, Iterator
 from dataclasses import dataclass, field
-from typing import Any, Generic, TypeVar
+from typing import Any, Generic, NamedTuple, TypeVar
 
 K = TypeVar("K", bound=Hashable)
 V = TypeVar("V")
 
 
-@dataclass
+@dataclass(slots=True)
 class Node:
     id: str
     text: str
@@ -21,6 +21,210 @@ class Node:
     children: bool = False
 
 
+class Entry(NamedTuple):
+    """A member of an archive, as listed by an adapter.
+
+    ``size`` (uncompressed) and ``compressed_size`` are in bytes and
+    ``modified_at`` is a UNIX time, ``None`` if the archive doesn't record
+    them.
+    """
+
+    path: str
+    is_dir: bool
+    size: int | None = None
+    modified_at: int | None = None
+    compressed_size: int | None = None
+
+
+DEFAULT_STATE = {"opened": True}
+DEFAULT_A_ATTR = {"tabindex": "0"}
+TABLE_FIELDS = ("size", "compressed_size", "modified_at", "file_count")
+
+
+class NodeTable:
+    """An archive tree stored column by column.
+
+    Every field of the nodes is kept in a list with one entry per node, in
+    tree order, instead of a ``Node`` with dicts of its own per entry, so a
+    tree of a million entries doesn't turn into millions of small objects.
+    The table values (sizes, modification date and, for directories, the
+    number of files below them) are ``None`` if the node has none, and the
+    fields that differ from what adapters usually set are kept in the
+    sparse ``extra`` mapping.
+
+    Indexing or iterating the table builds ``Node`` objects on the fly, for
+    code that needs a single node rather than the columns.
+    """
+
+    __slots__ = (
+        "_child_rows",
+        "children",
+        "compressed_sizes",
+        "extra",
+        "file_counts",
+        "icons",
+        "ids",
+        "modified_at",
+        "parents",
+        "sizes",
+        "texts",
+    )
+
+    def __init__(self) -> None:
+        self.ids: list[str] = []
+        self.texts: list[str] = []
+        self.parents: list[str] = []
+        self.icons: list[str] = []
+        self.sizes: list[Any] = []
+        self.compressed_sizes: list[Any] = []
+        self.modified_at: list[Any] = []
+        self.file_counts: list[int | None] = []
+        self.children = bytearray()
+        self.extra: dict[int, dict[str, Any]] = {}
+        self._child_rows: dict[str, list[int]] | None = None
+
+    @classmethod
+    def from_nodes(cls, nodes: Iterable[Node]) -> NodeTable:
+        table = cls()
+
+        for node in nodes:
+            table.append(node)
+
+        return table
+
+    def append(self, node: Node) -> None:
+        if fields := _extra_fields(node):
+            self.extra[len(self.ids)] = fields
+
+        self.ids.append(node.id)
+        self.texts.append(node.text)
+        self.parents.append(node.parent)
+        self.icons.append(node.icon)
+
+        for name, column in self.table_columns.items():
+            column.append(node.data.get(name))
+
+        self.children.append(node.children)
+        self._child_rows = None
+
+    @property
+    def table_columns(self) -> dict[str, list[Any]]:
+        """The columns of the table values, by the name of the value."""
+        return dict(
+            zip(
+                TABLE_FIELDS,
+                (
+                    self.sizes,
+                    self.compressed_sizes,
+                    self.modified_at,
+                    self.file_counts,
+                ),
+            )
+        )
+
+    def child_rows(self, parent: str) -> list[int]:
+        """Return the rows of the direct children of ``parent``, in tree order.
+
+        The children of every node are indexed on the first call, so a tree
+        that is kept in memory is scanned once rather than on every lookup.
+        """
+        if self._child_rows is None:
+            self._child_rows = {}
+
+            for row, node_parent in enumerate(self.parents):
+                self._child_rows.setdefault(node_parent, []).append(row)
+
+        return self._child_rows.get(parent, [])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, index: int) -> Node:
+        if index < 0:
+            index += len(self.ids)
+
+        node = Node(
+            id=self.ids[index],
+            text=self.texts[index],
+            icon=self.icons[index],
+            parent=self.parents[index],
+            state=dict(DEFAULT_STATE),
+            data={
+                name: column[index]
+                for name, column in self.table_columns.items()
+                if column[index] is not None
+            },
+            children=bool(self.children[index]),
+        )
+
+        for name, value in self.extra.get(index, {}).items():
+            if name == "data":
+                node.data.update(value)
+            else:
+                setattr(node, name, value)
+
+        return node
+
+    def __iter__(self) -> Iterator[Node]:
+        return (self[index] for index in range(len(self.ids)))
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, NodeTable):
+            return NotImplemented
+
+        return all(
+            getattr(self, name) == getattr(other, name)
+            for name in self.__slots__
+            if not name.startswith("_")
+        )
+
+
+def _extra_fields(node: Node) -> dict[str, Any]:
+    """Collect the fields of a node that differ from what adapters usually set."""
+    fields: dict[str, Any] = {}
+
+    if node.state != DEFAULT_STATE:
+        fields["state"] = node.state
+
+    if node.li_attr is not None:
+        fields["li_attr"] = node.li_attr
+
+    if node.a_attr != DEFAULT_A_ATTR:
+        fields["a_attr"] = node.a_attr
+
+    if data := {k: v for k, v in node.data.items() if k not in TABLE_FIELDS}:
+        fields["data"] = data
+
+    return fields
+
+
+@dataclass
+class Fingerprint:
+    """Identifies the content of an archive.
+
+    ``etag`` and ``last_modified`` are the validators of a remote archive,
+    used to check whether it changed since.
+    """
+
+    value: str
+    etag: str | None = None
+    last_modified: str | None = None
+
+
+@dataclass
+class CachePointer:
+    """Links a resource to the cache key its archive is stored under."""
+
+    key: str
+    fingerprint: Fingerprint | None = None
+    # UNIX time of the last check that the archive is unchanged
+    checked_at: float = 0
+    # UNIX time of the last check that failed, e.g. as the server was down
+    retried_at: float = 0
+    # key of the archive before it changed, served until the new tree is built
+    previous_key: str | None = None
+
+
 class Registry(dict[K, V], Generic[K, V]):
     """A generic registry to store and retrieve items."""
 
@@ -1,25 +1,47 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import logging
 import math
+import os
 import pathlib
-from dataclasses import asdict
+import threading
+import time
+from collections.abc import Iterable
+from dataclasses import asdict, replace
+from datetime import UTC, datetime
 from typing import Any
 
 import redis
+from redis.exceptions import LockError
+from redis.lock import Lock
 
 import ckan.plugins.toolkit as tk
 from ckan.lib.redis import connect_to_redis
 
 import ckanext.unfold.adapters as unf_adapters
+import ckanext.unfold.cache as unf_cache
 import ckanext.unfold.config as unf_config
 import ckanext.unfold.exception as unf_exception
 import ckanext.unfold.types as unf_types
+from ckanext.unfold.search import PathIndex
 
 DEFAULT_DATE_FORMAT = "%d/%m/%Y - %H:%M"
-REDIS_CACHE_TTL = 3600 * 24  # 24 hour
 TEMPORARY_LINK_TTL = 300
+BUILD_POLL_INTERVAL = 0.25
+# delay before retrying a revalidation that failed, in seconds
+REVALIDATE_RETRY_DELAY = 60
+COMPACT_COLUMNS = (
+    "text",
+    "parent",
+    "icon",
+    "size",
+    "modified_at",
+    "children",
+    "compressed_size",
+    "file_count",
+)
 log = logging.getLogger(__name__)
 
 
@@ -104,7 +126,7 @@ def get_format_from_name(name: str) -> str:
     return pathlib.Path(name).suffix
 
 
-def printable_file_size(size_bytes: int) -> str:
+def printable_file_size(size_bytes: float) -> str:
     if size_bytes == 0:
         return "0 B"
     size_name = ("B", "KB", "MB", "GB", "TB")
@@ -114,12 +136,85 @@ def printable_file_size(size_bytes: int) -> str:
     return f"{s} {size_name[i]}"
 
 
+def timestamp_from_datetime(value: datetime) -> int:
+    """Return the UNIX time of a datetime, taking a naive one as UTC."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=UTC)
+
+    return int(value.timestamp())
+
+
+class MetadataFormatter:
+    """Format the sizes and modification times of nodes for display.
+
+    Adapters record raw values, bytes and UNIX time, which are formatted
+    only when a response is serialized, so a cached tree serves every
+    display timezone. Archives repeat the same values a lot,
+    e.g. files extracted at once share their timestamp, so each distinct
+    value is formatted once per formatter. Values that are already strings
+    are passed through.
+    """
+
+    def __init__(self) -> None:
+        self._sizes: dict[Any, str] = {}
+        self._dates: dict[Any, str] = {}
+
+    def size(self, value: Any) -> str:
+        if not isinstance(value, (int, float)):
+            return value or ""
+
+        if (text := self._sizes.get(value)) is None:
+            text = self._sizes[value] = printable_file_size(value) if value else ""
+
+        return text
+
+    def modified_at(self, value: Any) -> str:
+        # 0 is no date at all, in both response formats
+        if not value or not isinstance(value, (int, float)):
+            return value or ""
+
+        if (text := self._dates.get(value)) is None:
+            try:
+                # naive, as render_datetime only converts those from UTC to
+                # the display timezone
+                date = datetime.fromtimestamp(value, UTC).replace(tzinfo=None)
+            except (OverflowError, OSError, ValueError):
+                text = ""
+            else:
+                text = tk.h.render_datetime(date, date_format=DEFAULT_DATE_FORMAT)
+
+            text = self._dates[value] = text or ""
+
+        return text
+
+
 class UnfoldCacheManager:
-    """Singleton storage for archive structures in Redis."""
+    """Singleton storage for archive structures in Redis.
+
+    Structures are stored under a cache key derived from the archive
+    content (see ``get_cache_pointer``), so an archive linked from several
+    resources is stored once. Each resource refers to its cache key through
+    a small pointer entry.
+
+    Recently used structures are also kept in an in-process LRU cache in
+    front of Redis, so hot archives are served without a round trip or
+    deserialization. Deletions are broadcast to every worker through Redis
+    pub/sub to keep the in-process caches in sync.
+    """
 
     _instance = None
     _conn: redis.Redis | None = None
+    _memory: unf_cache.MemoryCache | None = None
+    _listener: Any = None
+    _listener_pid: int | None = None
+    _lock = threading.Lock()
     _PREFIX = "ckanext:unfold:tree:"
+    _RESPONSE_PREFIX = "ckanext:unfold:response:"
+    _POINTER_PREFIX = "ckanext:unfold:resource:"
+    _LOCK_PREFIX = "ckanext:unfold:lock:"
+    _ERROR_PREFIX = "ckanext:unfold:error:"
+    _INDEX_PREFIX = "ckanext:unfold:index:"
+    _CHANNEL = "ckanext:unfold:invalidate"
 
     @classmethod
     def _ensure_conn(cls) -> redis.Redis:
@@ -129,39 +224,419 @@ class UnfoldCacheManager:
         return cls._conn
 
     @classmethod
-    def _key(cls, resource_id: str) -> str:
-        return f"{cls._PREFIX}{resource_id}"
+    def _key(cls, cache_key: str) -> str:
+        return f"{cls._PREFIX}{cache_key}"
+
+    @classmethod
+    def _response_key(cls, cache_key: str) -> str:
+        return f"{cls._RESPONSE_PREFIX}{cache_key}"
+
+    @classmethod
+    def _index_key(cls, cache_key: str) -> str:
+        return f"{cls._INDEX_PREFIX}{cache_key}"
+
+    @classmethod
+    def _error_key(cls, cache_key: str) -> str:
+        return f"{cls._ERROR_PREFIX}{cache_key}"
+
+    @classmethod
+    def _pointer_key(cls, resource_id: str) -> str:
+        return f"{cls._POINTER_PREFIX}{resource_id}"
+
+    @staticmethod
+    def resource_cache_key(resource_id: str) -> str:
+        """Return the cache key of an archive whose content can't be identified."""
+        return f"resource-{resource_id}"
+
+    @classmethod
+    def _memory_cache(cls) -> unf_cache.MemoryCache | None:
+        """Return the in-process cache, if it's enabled and kept in sync."""
+        max_size = unf_config.get_memory_cache_max_size()
+
+        if not max_size:
+            return None
+
+        if cls._memory is None:
+            cls._memory = unf_cache.MemoryCache(max_size)
+
+        if not cls._ensure_listener():
+            return None
+
+        return cls._memory
+
+    @classmethod
+    def _ensure_listener(cls) -> bool:
+        """Make sure this process listens for invalidations from other workers.
+
+        The listener is (re)started after a fork or a lost connection. The
+        in-process cache is cleared whenever that happens, as it may have
+        missed invalidations in the meantime. If subscribing fails, the
+        in-process cache is bypassed rather than risk serving stale trees.
+        """
+        with cls._lock:
+            if (
+                cls._listener is not None
+                and cls._listener_pid == os.getpid()
+                and cls._listener.is_alive()
+            ):
+                return True
+
+            try:
+                pubsub = cls._ensure_conn().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(**{cls._CHANNEL: cls._on_invalidate})
+                cls._listener = pubsub.run_in_thread(
+                    sleep_time=1,
+                    daemon=True,
+                    exception_handler=cls._on_listener_error,
+                )
+            except redis.RedisError:
+                log.exception("Unfold: cannot subscribe to cache invalidations")
+                return False
+
+            cls._listener_pid = os.getpid()
+
+            if cls._memory is not None:
+                cls._memory.clear()
+
+        return True
+
+    @classmethod
+    def _on_invalidate(cls, message: dict[str, Any]) -> None:
+        cls._evict(message["data"].decode())
+
+    @classmethod
+    def _evict(cls, resource_id: str) -> None:
+        """Drop everything cached in-process for a resource."""
+        if cls._memory is None:
+            return
+
+        cache_key = cls.resource_cache_key(resource_id)
+
+        cls._memory.delete(cls._pointer_key(resource_id))
+        cls._memory.delete(cls._key(cache_key))
+        cls._memory.delete(cls._index_key(cache_key))
+        cls._memory.delete_prefix(f"{cls._response_key(cache_key)}:")
+
+    @classmethod
+    def get_pointer(cls, resource_id: str) -> unf_types.CachePointer | None:
+        """Return the pointer to the cache key of a resource's archive."""
+        key = cls._pointer_key(resource_id)
+        memory = cls._memory_cache()
+
+        if memory and (pointer := memory.get(key)) is not None:
+            return pointer
+
+        cls._conn = cls._ensure_conn()
+
+        pipeline = cls._conn.pipeline()
+        pipeline.get(key)
+        pipeline.ttl(key)
+        data, ttl = pipeline.execute()
+
+        if not data:
+            return None
+
+        raw = json.loads(data)
+        fingerprint = raw["fingerprint"]
+        pointer = unf_types.CachePointer(
+            key=raw["key"],
+            fingerprint=unf_types.Fingerprint(**fingerprint) if fingerprint else None,
+            checked_at=raw["checked_at"],
+            retried_at=raw.get("retried_at", 0),
+            previous_key=raw.get("previous_key"),
+        )
+
+        if memory:
+            memory.set(key, pointer, len(data), ttl)
+
+        return pointer
+
+    @classmethod
+    def save_pointer(cls, resource_id: str, pointer: unf_types.CachePointer) -> None:
+        """Point a resource to the cache key of its archive.
+
+        Other workers are notified, so they don't keep using an outdated
+        pointer from their in-process cache. This worker's copy is replaced
+        right away, rather than when the notification comes back.
+        """
+        key = cls._pointer_key(resource_id)
+        data = json.dumps(asdict(pointer))
+        ttl = unf_config.get_cache_ttl()
+
+        cls._conn = cls._ensure_conn()
+        cls._conn.setex(key, ttl, data)
+
+        if memory := cls._memory_cache():
+            memory.set(key, pointer, len(data), ttl)
+
+        cls._conn.publish(cls._CHANNEL, resource_id)
+
+    @classmethod
+    def build_lock(cls, cache_key: str) -> Lock:
+        """Return the lock held while the archive structure is being built.
+
+        The lock expires on its own, so a crashed builder doesn't block
+        others forever.
+        """
+        return cls._ensure_conn().lock(
+            f"{cls._LOCK_PREFIX}{cache_key}",
+            timeout=unf_config.get_build_lock_timeout(),
+        )
+
+    @classmethod
+    def schedule_build(cls, cache_key: str) -> bool:
+        """Claim the right to schedule a background build of a structure.
+
+        Returns ``False`` if it was already claimed recently.
+        """
+        cls._conn = cls._ensure_conn()
+
+        return bool(
+            cls._conn.set(
+                f"{cls._LOCK_PREFIX}{cache_key}:scheduled",
+                1,
+                nx=True,
+                ex=unf_config.get_build_lock_timeout(),
+            )
+        )
+
+    @classmethod
+    def save_index(cls, index: PathIndex, cache_key: str) -> None:
+        """Save the path index of an archive structure."""
+        cls._conn = cls._ensure_conn()
+        key = cls._index_key(cache_key)
+        cls._conn.setex(key, unf_config.get_cache_ttl(), unf_cache.encode_index(index))
+
+        if memory := cls._memory_cache():
+            memory.set(key, index, index.size, unf_config.get_cache_ttl())
+
+    @classmethod
+    def get_index(cls, cache_key: str) -> PathIndex | None:
+        """Retrieve the path index of an archive structure, if it was saved."""
+        key = cls._index_key(cache_key)
+        memory = cls._memory_cache()
+
+        if memory and (index := memory.get(key)) is not None:
+            return index
+
+        cls._conn = cls._ensure_conn()
+
+        pipeline = cls._conn.pipeline()
+        pipeline.get(key)
+        pipeline.ttl(key)
+        data, ttl = pipeline.execute()
+
+        if not data:
+            return None
+
+        try:
+            index = unf_cache.decode_index(data)
+        except unf_cache.CacheFormatError:
+            log.warning("Unfold: dropping outdated cache entry %s", key)
+            cls._conn.delete(key)
+            return None
+
+        if memory:
+            memory.set(key, index, index.size, ttl)
+
+        return index
+
+    @classmethod
+    def save_error(cls, cache_key: str, variant: str, message: str) -> None:
+        """Remember that building an archive structure failed.
+
+        Failures are kept for a short time only, as some of them (e.g. an
+        unreachable server) may be temporary. A structure may fail for one
+        ``variant`` of the build options (e.g. a wrong password) and not for
+        another, so they are stored separately.
+        """
+        ttl = unf_config.get_error_cache_ttl()
+
+        if not ttl:
+            return
+
+        cls._conn = cls._ensure_conn()
+        key = cls._error_key(cache_key)
+
+        pipeline = cls._conn.pipeline()
+        pipeline.hset(key, variant, message)
+        pipeline.expire(key, ttl)
+        pipeline.execute()
+
+    @classmethod
+    def get_error(cls, cache_key: str, variant: str) -> str | None:
+        """Return the message of a recent failure to build a structure, if any."""
+        if not unf_config.get_error_cache_ttl():
+            return None
+
+        cls._conn = cls._ensure_conn()
+        message: bytes | None = cls._conn.hget(  # type: ignore
+            cls._error_key(cache_key), variant
+        )
+
+        return message.decode() if message else None
+
+    @classmethod
+    def touch(cls, cache_key: str) -> None:
+        """Extend the lifetime of a cached archive structure and its responses."""
+        cls._conn = cls._ensure_conn()
+        ttl = unf_config.get_cache_ttl()
+
+        pipeline = cls._conn.pipeline()
+        pipeline.expire(cls._key(cache_key), ttl)
+        pipeline.expire(cls._response_key(cache_key), ttl)
+        pipeline.expire(cls._index_key(cache_key), ttl)
+        pipeline.execute()
+
+    @staticmethod
+    def _on_listener_error(
+        error: BaseException, pubsub: Any, thread: threading.Thread
+    ) -> None:
+        log.error("Unfold: cache invalidation listener failed: %s", error)
+        thread.stop()  # type: ignore
+        pubsub.close()
 
     @classmethod
-    def save(cls, nodes: list[unf_types.Node], resource_id: str) -> None:
+    def save(cls, nodes: unf_types.NodeTable, cache_key: str) -> None:
         """Save an archive structure to Redis."""
         cls._conn = cls._ensure_conn()
 
-        data = json.dumps([asdict(n) for n in nodes])
-        cls._conn.setex(cls._key(resource_id), REDIS_CACHE_TTL, data)
+        data = unf_cache.encode_nodes(nodes)
+        cls._conn.setex(cls._key(cache_key), unf_config.get_cache_ttl(), data)
+
+        if memory := cls._memory_cache():
+            memory.set(
+                cls._key(cache_key),
+                nodes,
+                unf_cache.decoded_size(data),
+                unf_config.get_cache_ttl(),
+            )
 
     @classmethod
-    def get(cls, resource_id: str) -> list[unf_types.Node]:
-        """Retrieve an archive structure from Redis."""
+    def get(cls, cache_key: str) -> unf_types.NodeTable:
+        """Retrieve an archive structure from the in-process cache or Redis.
+
+        The returned table may be shared with other requests and must not be
+        modified. It's empty if the structure is not cached.
+        """
+        key = cls._key(cache_key)
+        memory = cls._memory_cache()
+
+        if memory and (nodes := memory.get(key)) is not None:
+            return nodes
+
         cls._conn = cls._ensure_conn()
 
-        data: bytes = cls._conn.get(cls._key(resource_id))  # type: ignore
+        pipeline = cls._conn.pipeline()
+        pipeline.get(key)
+        pipeline.ttl(key)
+        data, ttl = pipeline.execute()
 
         if not data:
-            return []
+            return unf_types.NodeTable()
 
-        raw = json.loads(data)
-        return [unf_types.Node(**n) for n in raw]
+        try:
+            nodes = unf_cache.decode_nodes(data)
+        except unf_cache.CacheFormatError:
+            log.warning("Unfold: dropping outdated cache entry %s", key)
+            cls._conn.delete(key)
+            return unf_types.NodeTable()
+
+        if memory:
+            memory.set(key, nodes, unf_cache.decoded_size(data), ttl)
+
+        return nodes
+
+    @classmethod
+    def save_response(cls, response: str, cache_key: str, variant: str) -> None:
+        """Save a serialized API response for an archive structure.
+
+        An archive may have several responses, one per ``variant`` of the
+        serialization options. They are stored in a single Redis hash, so
+        they expire and are deleted together.
+        """
+        cls._conn = cls._ensure_conn()
+        key = cls._response_key(cache_key)
+
+        pipeline = cls._conn.pipeline()
+        pipeline.hset(key, variant, unf_cache.encode_response(response))
+        pipeline.expire(key, unf_config.get_cache_ttl())
+        pipeline.execute()
+
+        if memory := cls._memory_cache():
+            memory.set(
+                f"{key}:{variant}", response, len(response), unf_config.get_cache_ttl()
+            )
+
+    @classmethod
+    def get_response(cls, cache_key: str, variant: str) -> str | None:
+        """Retrieve a serialized API response from the in-process cache or Redis."""
+        key = cls._response_key(cache_key)
+        memory = cls._memory_cache()
+
+        if memory and (response := memory.get(f"{key}:{variant}")) is not None:
+            return response
+
+        cls._conn = cls._ensure_conn()
+
+        pipeline = cls._conn.pipeline()
+        pipeline.hget(key, variant)
+        pipeline.ttl(key)
+        data, ttl = pipeline.execute()
+
+        if not data:
+            return None
+
+        try:
+            response = unf_cache.decode_response(data)
+        except unf_cache.CacheFormatError:
+            log.warning("Unfold: dropping outdated cache entry %s", key)
+            cls._conn.hdel(key, variant)
+            return None
+
+        if memory:
+            memory.set(f"{key}:{variant}", response, len(response), ttl)
+
+        return response
 
     @classmethod
     def delete(cls, resource_id: str) -> None:
-        """Delete an archive structure from Redis."""
+        """Forget the archive structure of a resource in Redis and every worker.
+
+        Only the resource's pointer is removed: an archive identified by its
+        content may be shared with other resources, and the resource will be
+        pointed at a new cache key once its content changes. Structures
+        cached per resource are removed outright.
+        """
         cls._conn = cls._ensure_conn()
-        cls._conn.delete(cls._key(resource_id))  # type: ignore
+        cache_key = cls.resource_cache_key(resource_id)
+        keys = [
+            cls._pointer_key(resource_id),
+            cls._key(cache_key),
+            cls._response_key(cache_key),
+            cls._index_key(cache_key),
+            cls._error_key(cache_key),
+        ]
+
+        # failures are retried right away after an update, even if the
+        # content is the same
+        if pointer := cls._conn.get(cls._pointer_key(resource_id)):
+            keys.append(cls._error_key(json.loads(pointer)["key"]))
+
+        cls._conn.delete(*keys)
+        cls._evict(resource_id)
+        cls._conn.publish(cls._CHANNEL, resource_id)
 
     @classmethod
     def close(cls) -> None:
-        """Close the shared Redis connection."""
+        """Close the shared Redis connection and the invalidation listener."""
+        if cls._listener is not None:
+            cls._listener.stop()
+            cls._listener = None
+
+        if cls._memory is not None:
+            cls._memory.clear()
+
         if not cls._conn:
             return
 
@@ -171,26 +646,450 @@ class UnfoldCacheManager:
 
 def get_archive_tree(
     resource: dict[str, Any], resource_view: dict[str, Any]
-) -> list[unf_types.Node]:
-    cache_enabled = unf_config.is_cache_enabled()
+) -> unf_types.NodeTable:
+    if not unf_config.is_cache_enabled():
+        return _build_archive_tree(_get_adapter_cls(resource), resource_view, resource)
 
-    if cache_enabled:
-        cached_tree = UnfoldCacheManager.get(resource["id"])
+    archive_tree, _ = _get_cached_archive_tree(
+        get_cache_pointer(resource, resource_view), resource, resource_view
+    )
 
-        if cached_tree:
-            return cached_tree
+    return archive_tree
 
-    adapter_cls = get_adapter_for_resource(resource)
-    if adapter_cls is None:
-        res_format = resource["format"].lower()
-        raise unf_exception.UnfoldError(f"No adapter for `{res_format}` archives")
 
-    archive_tree = _build_archive_tree(adapter_cls, resource_view, resource)
+def _get_cached_archive_tree(
+    pointer: unf_types.CachePointer,
+    resource: dict[str, Any],
+    resource_view: dict[str, Any],
+    serve_stale: bool = True,
+) -> tuple[unf_types.NodeTable, bool]:
+    """Return the cached archive tree, building it if it's missing.
 
-    if cache_enabled:
-        UnfoldCacheManager.save(archive_tree, resource["id"])
+    Only one process builds a given tree at a time: it holds a lock in
+    Redis, while concurrent requests for the same archive wait for the
+    result to appear in the cache instead of downloading the archive too.
+    Failures are cached as well, for a short time, so a broken archive isn't
+    downloaded again on every request.
+    If the archive has changed and the tree of its previous version is
+    still cached, that one is served meanwhile (and rebuilt in a background
+    job, if those are enabled) instead of waiting.
 
-    return archive_tree
+    Returns the tree and whether it's up to date.
+    """
+    cached_tree = UnfoldCacheManager.get(pointer.key)
+
+    if cached_tree:
+        return cached_tree, True
+
+    error_variant = _get_error_variant(resource_view)
+
+    if message := UnfoldCacheManager.get_error(pointer.key, error_variant):
+        raise unf_exception.UnfoldError(message)
+
+    stale_tree = unf_types.NodeTable()
+
+    if serve_stale and pointer.previous_key:
+        stale_tree = UnfoldCacheManager.get(pointer.previous_key)
+
+    if stale_tree and unf_config.is_prewarm_enabled():
+        try:
+            if UnfoldCacheManager.schedule_build(pointer.key):
+                tk.enqueue_job(
+                    prewarm_archive_tree,
+                    [resource["id"]],
+                    title=f"Unfold: rebuild archive tree of resource {resource['id']}",
+                    queue=unf_config.get_prewarm_queue(),
+                )
+        except redis.RedisError:
+            # the tree is built right here instead
+            log.exception("Unfold: cannot enqueue archive tree build")
+        else:
+            return stale_tree, False
+
+    lock = UnfoldCacheManager.build_lock(pointer.key)
+    deadline = time.monotonic() + unf_config.get_build_wait_timeout()
+
+    while not lock.acquire(blocking=False):
+        if stale_tree:
+            return stale_tree, False
+
+        if time.monotonic() > deadline:
+            raise unf_exception.UnfoldError(
+                "The archive is still being processed. Please, try again later"
+            )
+
+        time.sleep(BUILD_POLL_INTERVAL)
+
+        if cached_tree := UnfoldCacheManager.get(pointer.key):
+            return cached_tree, True
+
+        if message := UnfoldCacheManager.get_error(pointer.key, error_variant):
+            raise unf_exception.UnfoldError(message)
+
+    try:
+        # the tree might have been saved right before the lock was acquired
+        if cached_tree := UnfoldCacheManager.get(pointer.key):
+            return cached_tree, True
+
+        try:
+            archive_tree = _build_archive_tree(
+                _get_adapter_cls(resource), resource_view, resource
+            )
+        except unf_exception.UnfoldError as e:
+            UnfoldCacheManager.save_error(pointer.key, error_variant, str(e))
+            raise
+
+        UnfoldCacheManager.save(archive_tree, pointer.key)
+    finally:
+        try:
+            lock.release()
+        except LockError:
+            log.warning("Unfold: build lock of %s expired", pointer.key)
+
+    return archive_tree, True
+
+
+def _get_error_variant(resource_view: dict[str, Any]) -> str:
+    """Tell apart failures that depend on the password set in a view."""
+    password = resource_view.get("archive_pass")
+
+    if not password:
+        return ""
+
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+def get_cache_key(resource: dict[str, Any], resource_view: dict[str, Any]) -> str:
+    """Return the key the archive of a resource is cached under."""
+    return get_cache_pointer(resource, resource_view).key
+
+
+def get_cache_pointer(
+    resource: dict[str, Any], resource_view: dict[str, Any]
+) -> unf_types.CachePointer:
+    """Return the pointer to the key the archive of a resource is cached under.
+
+    The key is derived from the adapter and the archive fingerprint (see
+    ``BaseAdapter.get_fingerprint``), so the same archive linked from
+    several resources is built and stored once. Archives without a
+    fingerprint are cached per resource. The key is remembered for every
+    resource, so the fingerprint is only computed when that pointer is
+    missing or was invalidated.
+
+    Once the pointer is older than the freshness window, a remote archive
+    is revalidated with a conditional request. If it's unchanged, the
+    cached tree is kept for another lifetime, otherwise the resource is
+    pointed to a new key and the tree is rebuilt. If the server can't tell,
+    the cached tree is served as is and the check is retried shortly.
+    """
+    pointer = UnfoldCacheManager.get_pointer(resource["id"])
+    revalidate_after = unf_config.get_revalidate_after()
+    now = time.time()
+
+    if pointer and (
+        pointer.fingerprint is None
+        or now - pointer.checked_at < revalidate_after
+        or now - pointer.retried_at < min(REVALIDATE_RETRY_DELAY, revalidate_after)
+    ):
+        return pointer
+
+    adapter_cls = _get_adapter_cls(resource)
+    adapter = adapter_cls(resource, resource_view)
+
+    if pointer and pointer.fingerprint:
+        try:
+            fingerprint = adapter.revalidate(pointer.fingerprint)
+        except unf_exception.UnfoldError as e:
+            log.warning("Unfold: cannot revalidate %s: %s", resource["id"], e)
+            pointer = replace(pointer, retried_at=now)
+            UnfoldCacheManager.save_pointer(resource["id"], pointer)
+
+            return pointer
+
+        if fingerprint is pointer.fingerprint:
+            pointer = replace(pointer, checked_at=now)
+
+            UnfoldCacheManager.touch(pointer.key)
+            UnfoldCacheManager.save_pointer(resource["id"], pointer)
+
+            return pointer
+    else:
+        fingerprint = adapter.get_fingerprint()
+
+    if fingerprint:
+        adapter_name = f"{adapter_cls.__module__}.{adapter_cls.__qualname__}"
+        cache_key = hashlib.sha256(
+            f"{adapter_name}\0{fingerprint.value}".encode()
+        ).hexdigest()
+    else:
+        cache_key = UnfoldCacheManager.resource_cache_key(resource["id"])
+
+    new_pointer = unf_types.CachePointer(
+        cache_key,
+        fingerprint,
+        checked_at=now,
+        previous_key=pointer.key if pointer else None,
+    )
+    UnfoldCacheManager.save_pointer(resource["id"], new_pointer)
+
+    return new_pointer
+
+
+def get_archive_structure_response(
+    resource: dict[str, Any],
+    resource_view: dict[str, Any],
+    parent: str | None = None,
+    lazy: bool = False,
+    compact: bool = False,
+) -> str:
+    """Return the archive tree of a resource serialized for the API.
+
+    With ``parent``, only the direct children of that directory (``#`` for
+    the top level) are returned, flagged with ``children`` if they can be
+    expanded, so the tree view can load a huge archive one directory at a
+    time. With ``lazy``, the same is done for the top level if the archive
+    has more entries than the lazy loading threshold, and the whole tree is
+    returned otherwise. With ``compact``, the nodes are serialized into the
+    compact format (see ``_serialize_compact``) instead of jstree nodes.
+
+    The JSON is cached as is, keyed by the options that affect it, so a warm
+    hit skips both building the tree and serializing its nodes.
+    """
+    if not unf_config.is_cache_enabled():
+        return _serialize_tree(
+            get_archive_tree(resource, resource_view), parent, lazy, compact
+        )
+
+    pointer = get_cache_pointer(resource, resource_view)
+    threshold = unf_config.get_expand_nodes_threshold()
+    cache_response = unf_config.is_response_cache_enabled()
+
+    if parent is not None:
+        variant = f"parent={parent}"
+    elif lazy:
+        lazy_threshold = unf_config.get_lazy_load_threshold()
+        variant = f"expand_threshold={threshold};lazy_threshold={lazy_threshold}"
+    else:
+        variant = f"expand_threshold={threshold}"
+
+    if compact:
+        variant += ";format=compact"
+
+    # dates are formatted into the response in the display timezone
+    variant += f";timezone={tk.config.get('ckan.display_timezone')}"
+
+    if cache_response:
+        cached_response = UnfoldCacheManager.get_response(pointer.key, variant)
+
+        if cached_response is not None:
+            return cached_response
+
+    archive_tree, up_to_date = _get_cached_archive_tree(
+        pointer, resource, resource_view
+    )
+    response = _serialize_tree(archive_tree, parent, lazy, compact)
+
+    # any string can be sent as ``parent``, so only the children of actual
+    # directories are cached, which bounds the number of variants
+    if (
+        cache_response
+        and up_to_date
+        and (parent in (None, "#") or archive_tree.child_rows(parent))
+    ):
+        UnfoldCacheManager.save_response(response, pointer.key, variant)
+
+    return response
+
+
+def search_archive_tree(
+    resource: dict[str, Any],
+    resource_view: dict[str, Any],
+    query: str,
+    limit: int,
+) -> dict[str, Any]:
+    """Search the paths of an archive tree.
+
+    Returns the nodes matching ``query`` (see ``PathIndex.search``) along
+    with their ancestors, so they can be shown in place in the tree, the ids
+    of the matching nodes, and whether more than ``limit`` nodes matched.
+    The path index is cached next to the tree.
+    """
+    if not unf_config.is_cache_enabled():
+        archive_tree = get_archive_tree(resource, resource_view)
+        index = PathIndex.from_tree(archive_tree)
+    else:
+        pointer = get_cache_pointer(resource, resource_view)
+        archive_tree, up_to_date = _get_cached_archive_tree(
+            pointer, resource, resource_view
+        )
+        index = UnfoldCacheManager.get_index(pointer.key) if up_to_date else None
+
+        # the tree might have been rebuilt differently since (e.g. by a newer
+        # version of its adapter) while the index was still cached
+        if index is None or len(index.parents) != len(archive_tree):
+            index = PathIndex.from_tree(archive_tree)
+
+            if up_to_date:
+                UnfoldCacheManager.save_index(index, pointer.key)
+
+    matches, truncated = index.search(query, limit)
+    formatter = MetadataFormatter()
+
+    return {
+        "nodes": [
+            _serialize_node(archive_tree, line, formatter, False)
+            for line in index.with_ancestors(matches)
+        ],
+        "matches": [archive_tree.ids[line] for line in matches],
+        "truncated": truncated,
+    }
+
+
+def _serialize_tree(
+    nodes: unf_types.NodeTable,
+    parent: str | None = None,
+    lazy: bool = False,
+    compact: bool = False,
+) -> str:
+    if parent is None and lazy and len(nodes) > unf_config.get_lazy_load_threshold():
+        parent = "#"
+
+    if parent is None:
+        # close nodes by default if above threshold
+        close_folders = len(nodes) > unf_config.get_expand_nodes_threshold()
+        rows: Iterable[int] = range(len(nodes))
+    else:
+        rows = nodes.child_rows(parent)
+        close_folders = lazy = True
+
+    if compact:
+        serialized = _serialize_compact(nodes, rows, close_folders, lazy)
+    else:
+        formatter = MetadataFormatter()
+        serialized = [
+            _serialize_node(nodes, i, formatter, close_folders, lazy) for i in rows
+        ]
+
+    return json.dumps(serialized, separators=(",", ":"))
+
+
+def _serialize_compact(
+    nodes: unf_types.NodeTable, rows: Iterable[int], close_folders: bool, lazy: bool
+) -> dict[str, Any]:
+    """Serialize nodes into the compact format of ``get_archive_structure``.
+
+    Each node is a row of ``COMPACT_COLUMNS``, with the parent and the icon
+    given as indexes into the ``parents`` and ``icons`` tables. A node id is
+    the path of its parent joined with its text (just the text at the top
+    level) and only sent, in ``ids``, if it's different. Sizes are sent as
+    the raw numbers recorded by adapters and formatted by the client. Dates
+    are formatted here, in the display timezone as in the jstree format,
+    and given as indexes into the ``dates`` table. Every node gets the
+    ``a_attr`` of the response, and the fields some nodes set on their own
+    (e.g. links of a custom adapter) are sent in ``extra``, by row, to be
+    applied on top as in the jstree format.
+    """
+    parents: dict[str, int] = {}
+    icons: dict[str, int] = {}
+    ids: dict[int, str] = {}
+    extra: dict[int, dict[str, Any]] = {}
+    dates: dict[str, int] = {}
+    formatter = MetadataFormatter()
+    compact_rows: list[list[Any]] = []
+
+    for row, index in enumerate(rows):
+        node_id = nodes.ids[index]
+        text = nodes.texts[index]
+        parent = nodes.parents[index]
+
+        if node_id != (text if parent == "#" else f"{parent}/{text}"):
+            ids[row] = node_id
+
+        modified_at = formatter.modified_at(nodes.modified_at[index])
+
+        # the state is up to the response, as in ``_serialize_node``
+        if fields := {
+            name: value
+            for name, value in nodes.extra.get(index, {}).items()
+            if name != "state"
+        }:
+            extra[row] = fields
+
+        compact_rows.append(
+            [
+                text,
+                parents.setdefault(parent, len(parents)),
+                icons.setdefault(nodes.icons[index], len(icons)),
+                nodes.sizes[index] or None,
+                dates.setdefault(modified_at, len(dates)) if modified_at else None,
+                int(lazy and nodes.children[index]),
+                nodes.compressed_sizes[index] or None,
+                nodes.file_counts[index],
+            ]
+        )
+
+    return {
+        "format": "compact",
+        "columns": COMPACT_COLUMNS,
+        "opened": not close_folders,
+        "parents": list(parents),
+        "icons": list(icons),
+        "dates": list(dates),
+        "ids": ids,
+        "a_attr": unf_types.DEFAULT_A_ATTR,
+        "extra": extra,
+        "rows": compact_rows,
+    }
+
+
+def _serialize_node(
+    nodes: unf_types.NodeTable,
+    index: int,
+    formatter: MetadataFormatter,
+    close_folders: bool,
+    lazy: bool = False,
+) -> dict[str, Any]:
+    size = formatter.size(nodes.sizes[index])
+    modified_at = formatter.modified_at(nodes.modified_at[index])
+    text = nodes.texts[index]
+
+    if size or modified_at:
+        text += "<span class='unfold-node-metadata'>"
+
+        if size:
+            text += f' <span class="unfold-node-size">{size}</span>'
+
+        if modified_at:
+            text += f' <span class="unfold-node-modified-at">{modified_at}</span>'
+
+        text += "</span>"
+
+    data: dict[str, Any] = {
+        "id": nodes.ids[index],
+        "text": text,
+        "icon": nodes.icons[index],
+        "parent": nodes.parents[index],
+        "state": {"opened": not close_folders},
+        "data": {
+            "size": size,
+            "compressed_size": formatter.size(nodes.compressed_sizes[index]),
+            "modified_at": modified_at,
+            "file_count": nodes.file_counts[index],
+        },
+        "li_attr": None,
+        "a_attr": dict(unf_types.DEFAULT_A_ATTR),
+        # in a complete tree, the view finds the children of a node by their
+        # parent, and ``children`` would make it try to load them on demand
+        "children": bool(lazy and nodes.children[index]),
+    }
+
+    for name, value in nodes.extra.get(index, {}).items():
+        if name == "data":
+            data["data"].update(value)
+        elif name != "state":
+            data[name] = value
+
+    return data
 
 
 def _build_archive_tree(
@@ -198,11 +1097,47 @@ def _build_archive_tree(
     resource_view: dict[str, Any],
     resource: dict[str, Any],
     filepath: str | None = None,
-) -> list[unf_types.Node]:
+) -> unf_types.NodeTable:
     adapter_instance = adapter_cls(resource, resource_view, filepath=filepath)
     return adapter_instance.build_archive_tree()
 
 
+def prewarm_archive_tree(resource_id: str) -> None:
+    """Build the archive tree of a resource and fill the cache with it.
+
+    Runs as a background job after a resource is created or updated, so
+    visitors don't pay for downloading and parsing the archive.
+    """
+    if not unf_config.is_cache_enabled():
+        return
+
+    try:
+        resource = tk.get_action("resource_show")(
+            {"ignore_auth": True}, {"id": resource_id}
+        )
+    except tk.ObjectNotFound:
+        # deleted since, or not committed yet when enqueued with its dataset
+        log.warning("Unfold: resource %s to prewarm is not found", resource_id)
+        return
+
+    try:
+        _get_cached_archive_tree(
+            get_cache_pointer(resource, {}), resource, {}, serve_stale=False
+        )
+    except unf_exception.UnfoldError as e:
+        log.warning("Unfold: cannot build archive tree of %s: %s", resource_id, e)
+
+
+def _get_adapter_cls(resource: dict[str, Any]) -> type[unf_adapters.BaseAdapter]:
+    adapter_cls = get_adapter_for_resource(resource)
+
+    if adapter_cls is None:
+        res_format = resource["format"].lower()
+        raise unf_exception.UnfoldError(f"No adapter for `{res_format}` archives")
+
+    return adapter_cls
+
+
 def get_adapter_for_resource(
     resource: dict[str, Any],
 ) -> type[unf_adapters.BaseAdapter] | None: